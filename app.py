@@ -2,10 +2,23 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 import pytz
-import psycopg2
-import re
 import itertools
-from difflib import SequenceMatcher
+import hmac
+
+import catalog_import
+import checkout
+import data
+import db
+import export
+import inventory
+import journal
+import livesync
+from matching import fuzzy_match, parse_multi_input
+import migrations
+import prefetch
+import profiler
+import sqltrace
+import summary
 
 # --- إعداد الصفحة ---
 st.set_page_config(page_title="Nawaem System", layout="wide", page_icon="📊", initial_sidebar_state="collapsed")
@@ -85,20 +98,26 @@ st.markdown("""
         color: white !important; 
         background-color: transparent !important;
     }
-    .stTabs [data-baseweb="tab-list"] {
+    .st-key-active_section div[role="radiogroup"] {
         gap: 8px;
         background-color: transparent;
         padding: 5px;
+        flex-wrap: wrap;
     }
-    .stTabs [data-baseweb="tab"] {
+    .st-key-active_section div[role="radiogroup"] > label {
         height: 45px;
+        padding: 0 14px;
         background-color: rgba(44, 44, 46, 0.5);
         border-radius: 10px;
         border: none;
         color: var(--subtext-color);
         font-weight: 600;
+        align-items: center;
+    }
+    .st-key-active_section div[role="radiogroup"] > label > div:first-child {
+        display: none;
     }
-    .stTabs [aria-selected="true"] {
+    .st-key-active_section div[role="radiogroup"] > label:has(input:checked) {
         background-color: #3A3A3C !important;
         color: var(--primary-color) !important;
     }
@@ -126,101 +145,29 @@ if 'last_customer_username' not in st.session_state:
     st.session_state.last_customer_username = None
 
 # --- 2. اتصال قاعدة البيانات (Supabase) ---
-@st.cache_resource
-def init_connection():
-    return psycopg2.connect(**st.secrets["postgres"])
-
 try:
-    conn = init_connection()
+    db.get_pool()
 except Exception as e:
     st.error(f"فشل الاتصال بقاعدة البيانات: {e}")
     st.stop()
 
-# دالة لتهيئة الجداول (تم تعديل نوع التاريخ إلى TIMESTAMP)
+# ترحيلات قاعدة البيانات: تُطبَّق مرة واحدة لكل عملية بدل تنفيذ DDL مع كل rerun
+@st.cache_resource
 def init_db():
-    try:
-        with conn.cursor() as c:
-            c.execute("""CREATE TABLE IF NOT EXISTS public.variants (
-                id SERIAL PRIMARY KEY, name TEXT, color TEXT, size TEXT, cost REAL, price REAL, stock INTEGER
-            )""")
-            c.execute("""CREATE TABLE IF NOT EXISTS public.customers (
-                id SERIAL PRIMARY KEY, name TEXT, phone TEXT, address TEXT, username TEXT
-            )""")
-            # تم تعديل date إلى TIMESTAMP
-            c.execute("""CREATE TABLE IF NOT EXISTS public.sales (
-                id SERIAL PRIMARY KEY, customer_id INTEGER, variant_id INTEGER, product_name TEXT, 
-                qty INTEGER, total REAL, profit REAL, date TIMESTAMP, invoice_id TEXT, delivery_duration TEXT
-            )""")
-            # تم تعديل date إلى TIMESTAMP
-            c.execute("""CREATE TABLE IF NOT EXISTS public.expenses (
-                id SERIAL PRIMARY KEY, amount REAL, reason TEXT, date TIMESTAMP
-            )""")
-
-            # جدول الرواجع الجديد
-            c.execute("""CREATE TABLE IF NOT EXISTS public.returns (
-                id SERIAL PRIMARY KEY, sale_id INTEGER, variant_id INTEGER, customer_id INTEGER,
-                product_name TEXT, product_details TEXT, qty INTEGER, return_amount REAL, 
-                return_date TIMESTAMP, status TEXT
-            )""")
-            
-            # التحقق من وجود column 'delivery_duration' وإضافته إذا لم يكن موجوداً
-            c.execute("SELECT column_name FROM information_schema.columns WHERE table_name='sales' AND column_name='delivery_duration'")
-            if not c.fetchone():
-                c.execute("ALTER TABLE public.sales ADD COLUMN delivery_duration TEXT")
-                
-            conn.commit()
-    except Exception as e:
-        conn.rollback()
-
-init_db()
-
-# --- 3.5. دوال مساعدة (Bulk & Fuzzy) ---
-def parse_multi_input(text):
-    """
-    Parses a string containing multiple values separated by commas, hyphens, or spaces.
-    Returns a list of clean strings.
-    """
-    if not text:
-        return []
-    
-    # Text normalization
-    text = text.strip()
-    
-    # Check for specific separators
-    if ',' in text or '،' in text:
-        # Split by comma (both English and Arabic)
-        parts = re.split(r'[,،]', text)
-    elif '-' in text:
-        # Split by hyphen
-        parts = text.split('-')
-    else:
-        # Split by whitespace
-        parts = text.split()
-        
-    # Clean up results
-    return [p.strip() for p in parts if p.strip()]
-
-def fuzzy_match(new_val, existing_vals, threshold=0.85):
-    """
-    Checks if new_val is similar to any item in existing_vals.
-    Returns the existing item if match found, otherwise returns new_val.
-    """
-    if not new_val:
-        return new_val
-        
-    best_match = None
-    best_ratio = 0.0
-    
-    for val in existing_vals:
-        if not val: continue
-        ratio = SequenceMatcher(None, new_val.lower(), val.lower()).ratio()
-        if ratio > best_ratio:
-            best_ratio = ratio
-            best_match = val
-            
-    if best_ratio >= threshold:
-        return best_match
-    return new_val
+    with db.connection() as c:
+        return migrations.migrate(c)
+
+try:
+    init_db()
+except Exception as e:
+    st.error(f"فشل تحديث هيكل قاعدة البيانات: {e}")
+    st.stop()
+
+# تغييرات الجلسات الأخرى تبطل الكاش عبر LISTEN/NOTIFY (عند تفعيله في secrets؛ الـ TTL يبقى كاحتياط)
+try:
+    livesync.get_listener()
+except Exception:
+    pass
 
 # --- 3. النوافذ المنبثقة ---
 @st.dialog("تعديل عملية بيع")
@@ -232,25 +179,25 @@ def edit_sale_dialog(sale_id, current_qty, current_total, variant_id, product_na
     with c1:
         if st.button("💾 حفظ التعديلات", type="primary"):
             try:
-                with conn.cursor() as cur:
+                with db.transaction() as cur:
+                    summary.sale_updated(cur, sale_id, new_qty, new_total)
                     diff = new_qty - int(current_qty)
                     if diff != 0:
                         cur.execute("UPDATE public.variants SET stock = stock - %s WHERE id = %s", (int(diff), int(variant_id)))
                     cur.execute("UPDATE public.sales SET qty = %s, total = %s WHERE id = %s", (int(new_qty), float(new_total), int(sale_id)))
-                    conn.commit()
-                    st.toast("✅ تم تحديث الفاتورة بنجاح")
-                    st.cache_data.clear(); st.rerun()
-            except: conn.rollback()
+                st.toast("✅ تم تحديث الفاتورة بنجاح")
+                data.invalidate("sales", "variants"); st.rerun()
+            except Exception: pass
     with c2:
         if st.button("🗑️ حذف العملية"):
             try:
-                with conn.cursor() as cur:
+                with db.transaction() as cur:
+                    summary.sale_deleted(cur, sale_id)
                     cur.execute("UPDATE public.variants SET stock = stock + %s WHERE id = %s", (int(current_qty), int(variant_id)))
                     cur.execute("DELETE FROM public.sales WHERE id = %s", (int(sale_id),))
-                    conn.commit()
-                    st.toast("🗑️ تم حذف الفاتورة")
-                    st.cache_data.clear(); st.rerun()
-            except: conn.rollback()
+                st.toast("🗑️ تم حذف الفاتورة")
+                data.invalidate("sales", "variants"); st.rerun()
+            except Exception: pass
 
 @st.dialog("تعديل المخزون")
 def edit_stock_dialog(item_id, name, color, size, cost, price, stock):
@@ -265,21 +212,19 @@ def edit_stock_dialog(item_id, name, color, size, cost, price, stock):
         n_stk = c5.number_input("عدد", value=int(stock))
         if st.form_submit_button("💾 حفظ التعديلات"):
             try:
-                with conn.cursor() as cur:
+                with db.transaction() as cur:
                     cur.execute("UPDATE public.variants SET name=%s, color=%s, size=%s, cost=%s, price=%s, stock=%s WHERE id=%s", 
                                  (n_name, n_col, n_siz, float(n_cst), float(n_prc), int(n_stk), int(item_id)))
-                    conn.commit()
-                    st.toast("✅ تم تحديث المخزون")
-                    st.cache_data.clear(); st.rerun()
-            except: conn.rollback()
+                st.toast("✅ تم تحديث المخزون")
+                data.invalidate("variants"); st.rerun()
+            except Exception: pass
     if st.button("🗑️ حذف الصنف نهائياً"):
         try:
-            with conn.cursor() as cur:
+            with db.transaction() as cur:
                 cur.execute("DELETE FROM public.variants WHERE id=%s", (int(item_id),))
-                conn.commit()
-                st.toast("🗑️ تم حذف الصنف")
-                st.cache_data.clear(); st.rerun()
-        except: conn.rollback()
+            st.toast("🗑️ تم حذف الصنف")
+            data.invalidate("variants"); st.rerun()
+        except Exception: pass
 
 # --- 3.5. دوال مساعدة للألوان ---
 def get_color_hex(color_name):
@@ -318,10 +263,7 @@ def edit_product_stock_dialog(product_name):
     st.markdown(f"### تعديل: {product_name}")
     try:
         # Load ALL variants (even stock=0) to allow restocking
-        df = pd.read_sql(
-            "SELECT id, color, size, stock, price, cost FROM public.variants WHERE name = %s ORDER BY color, size",
-            conn, params=(product_name,)
-        )
+        df = data.load_product_variants(product_name)
         
         if not df.empty:
             edited_df = st.data_editor(
@@ -341,26 +283,15 @@ def edit_product_stock_dialog(product_name):
             
             if st.button("💾 حفظ التغييرات", type="primary", key=f"save_btn_{hash(product_name)}"):
                 try:
-                    with conn.cursor() as cur:
-                        # Iterate through edited rows
-                        for idx, row in edited_df.iterrows():
-                            # Optimization: Only update if changed? 
-                            # interacting with dirty flags in DB is better but full update is safer for now.
-                            cur.execute("""
-                                UPDATE public.variants 
-                                SET stock=%s, price=%s, cost=%s, color=%s, size=%s
-                                WHERE id=%s
-                            """, (
-                                int(row['stock']), 
-                                float(row['price']), 
-                                float(row['cost']),
-                                row['color'],
-                                row['size'],
-                                int(row['id'])
-                            ))
-                        conn.commit()
-                        st.toast("✅ تم التحديث بنجاح")
-                        st.session_state['data_changed'] = True
+                    # إرسال الأسطر المعدلة فقط باستعلام واحد
+                    changed = inventory.changed_rows(df, edited_df)
+                    if changed.empty:
+                        st.info("لا توجد تغييرات للحفظ")
+                    else:
+                        with db.transaction() as cur:
+                            inventory.update_variants(cur, changed)
+                        st.toast(f"✅ تم تحديث {len(changed)} صنف بنجاح")
+                        data.invalidate("variants")
                         st.rerun()
                 except Exception as e:
                     st.error(f"خطأ في الحفظ: {e}")
@@ -377,47 +308,68 @@ def login_screen():
         st.session_state.logged_in = True
         st.rerun()
 
-# --- 5. التطبيق الرئيسي ---
-def main_app():
-    tabs = st.tabs(["🛍️ بيع", "📝 سجل", "↩️ رواجع", "👥 عملاء", "📦 مخزن", "💸 مصاريف", "📊 تقارير"])
-
-    # === 1. البيع ===
-    with tabs[0]:
-        if st.session_state.sale_success:
-            st.success("✅ تم حجز الطلب!")
-            st.balloons()
-            st.markdown("### 📋 انسخ الرسالة:")
-            st.code(st.session_state.last_invoice_text, language="text")
-            
-            # Instagram Button
-            if st.session_state.last_customer_username:
-                ig_url = f"https://ig.me/m/{st.session_state.last_customer_username}"
-                st.link_button(" إرسال الفاتورة عبر انستغرام", ig_url, type="primary")
-            
-            st.divider()
-            if st.button("🔄 طلب جديد", type="primary"):
-                st.session_state.sale_success = False; st.session_state.last_invoice_text = ""; st.rerun()
-        else:
-            with st.container(border=True):
-                try:
-                    df = pd.read_sql("SELECT * FROM public.variants WHERE stock > 0", conn)
-                except: df = pd.DataFrame()
+# --- 5. أقسام التطبيق ---
+# === 1. البيع ===
+def journal_status(local_journal):
+    """Pending count and rejected orders of the local checkout journal."""
+    counts = local_journal.counts()
+    if counts.get("pending"):
+        st.caption(f"⏳ {counts['pending']} طلب محفوظ على الجهاز بانتظار الإرسال")
+    rejected = local_journal.rejected()
+    if rejected:
+        with st.expander(f"⚠️ {len(rejected)} طلب لم يُسجل في قاعدة البيانات", expanded=True):
+            for key, order, error in rejected:
+                names = "، ".join(f"{x['name']} ({x['qty']})" for x in order['cart'])
+                c1, c2 = st.columns([4, 1])
+                c1.markdown(f"**{order['invoice_id']}** - {names}")
+                c1.caption(error or "")
+                if c2.button("تم", key=f"dismiss_{key}"):
+                    local_journal.set_status(key, "dismissed", error); st.rerun()
 
-                srch = st.text_input("🔍 بحث...", label_visibility="collapsed")
-                if srch and not df.empty:
-                    mask = df['name'].str.contains(srch, case=False) | df['color'].str.contains(srch, case=False)
-                    df = df[mask]
-                
-                if not df.empty:
-                    opts = df.apply(lambda x: f"{x['name']} | {x['color']} ({x['size']})", axis=1).tolist()
-                    sel = st.selectbox("اختر:", opts, label_visibility="collapsed")
-                    if sel:
-                        r = df[df.apply(lambda x: f"{x['name']} | {x['color']} ({x['size']})", axis=1) == sel].iloc[0]
-                        st.caption(f"سعر: {r['price']:,.0f} | متوفر: {r['stock']}")
+
+def sale_section():
+    if st.session_state.sale_success:
+        st.success("✅ تم حجز الطلب!")
+        st.balloons()
+        st.markdown("### 📋 انسخ الرسالة:")
+        st.code(st.session_state.last_invoice_text, language="text")
+        
+        # Instagram Button
+        if st.session_state.last_customer_username:
+            ig_url = f"https://ig.me/m/{st.session_state.last_customer_username}"
+            st.link_button(" إرسال الفاتورة عبر انستغرام", ig_url, type="primary")
+        
+        st.divider()
+        if st.button("🔄 طلب جديد", type="primary"):
+            st.session_state.sale_success = False; st.session_state.last_invoice_text = ""; st.rerun()
+    else:
+        local_journal = journal.get_journal()
+        if local_journal is not None:
+            journal_status(local_journal)
+        with st.container(border=True):
+            srch = st.text_input("🔍 بحث...", label_visibility="collapsed")
+            try:
+                df = data.search_variants(srch.strip())
+            except Exception: df = pd.DataFrame()
+
+            if not df.empty:
+                rows = {int(x['id']): x for x in df.to_dict('records')}
+                sel = st.selectbox(
+                    "اختر:", list(rows), label_visibility="collapsed",
+                    format_func=lambda i: f"{rows[i]['name']} | {rows[i]['color']} ({rows[i]['size']})"
+                )
+                if sel is not None:
+                    r = rows[sel]
+                    # الكميات المحجوزة بطلبات لم تُرسل بعد من السجل المحلي
+                    available = int(r['stock']) - (local_journal.reserved(r['read_at']).get(sel, 0) if local_journal else 0)
+                    st.caption(f"سعر: {r['price']:,.0f} | متوفر: {available}")
+                    if available < 1:
+                        st.warning("الكمية المتوفرة محجوزة بطلبات بانتظار الإرسال")
+                    else:
                         c1, c2 = st.columns(2)
-                        q = c1.number_input("العدد", 1, int(r['stock']), 1)
+                        q = c1.number_input("العدد", 1, available, 1)
                         p = c2.number_input("سعر", value=float(r['price']))
-                        
+                    
                         if st.button("🛒 أضف للسلة", type="secondary"):
                             item_dict = {
                                 "id": int(r['id']),  
@@ -427,796 +379,945 @@ def main_app():
                                 "cost": float(r['cost']), 
                                 "price": float(p), 
                                 "qty": int(q), 
-                                "total": float(p*q)
+                                "total": float(p*q),
+                                "stock": int(r['stock']),
+                                "read_at": float(r['read_at'])
                             }
                             st.session_state.cart.append(item_dict)
                             st.toast("تمت الإضافة", icon="✅")
 
-            if st.session_state.cart:
-                st.divider()
-                st.markdown("### 🛒 سلة المشتريات")
-                
-                for i, item in enumerate(st.session_state.cart):
-                    with st.container():
-                        st.markdown(f"""
-                        <div class="css-card" style="display: flex; justify-content: space-between; align-items: center;">
-                            <div style="text-align: right;">
-                                <div style="font-weight: 800; font-size: 1.1em; color: var(--text-color);">{item['name']}</div>
-                                <div style="color: var(--subtext-color); font-size: 0.9em; margin-top: 4px;">{item['color']} | {item['size']}</div>
-                                <div style="color: var(--primary-color); font-weight: 600; margin-top: 4px;">{item['qty']} × {item['price']:,.0f}</div>
-                            </div>
-                            <div style="text-align: left; font-weight: 800; color: var(--primary-color); font-size: 1.2em;">
-                                {item['total']:,.0f}
-                            </div>
+        if st.session_state.cart:
+            st.divider()
+            st.markdown("### 🛒 سلة المشتريات")
+            
+            for i, item in enumerate(st.session_state.cart):
+                with st.container():
+                    st.markdown(f"""
+                    <div class="css-card" style="display: flex; justify-content: space-between; align-items: center;">
+                        <div style="text-align: right;">
+                            <div style="font-weight: 800; font-size: 1.1em; color: var(--text-color);">{item['name']}</div>
+                            <div style="color: var(--subtext-color); font-size: 0.9em; margin-top: 4px;">{item['color']} | {item['size']}</div>
+                            <div style="color: var(--primary-color); font-weight: 600; margin-top: 4px;">{item['qty']} × {item['price']:,.0f}</div>
                         </div>
-                        """, unsafe_allow_html=True)
+                        <div style="text-align: left; font-weight: 800; color: var(--primary-color); font-size: 1.2em;">
+                            {item['total']:,.0f}
+                        </div>
+                    </div>
+                    """, unsafe_allow_html=True)
 
-                st.divider()
-                st.markdown("##### 👤 بيانات العميل")
-                with st.container(border=True):
-                    cust_type = st.radio("نوع العميل", ["جديد", "سابق"], horizontal=True)
-                    cust_id_val, cust_name_val, cust_username_val, cust_phone_val, cust_address_val = None, "", "", "", ""
-                    if cust_type == "سابق":
-                        try:
-                            curr_custs = pd.read_sql("SELECT id, name, phone, username, address FROM public.customers", conn)
-                        except: curr_custs = pd.DataFrame()
-                        
-                        if not curr_custs.empty:
-                            c_sel = st.selectbox("الاسم:", curr_custs.apply(lambda x: f"{x['name']} - {x['phone']}", axis=1).tolist())
-                            cust_name_val = c_sel.split(" - ")[0]
-                            selected_row = curr_custs[curr_custs['name'] == cust_name_val].iloc[0]
-                            cust_id_val = int(selected_row['id'])
-                            cust_username_val = selected_row['username'] if pd.notna(selected_row['username']) else ""
-                            cust_phone_val = selected_row['phone'] if pd.notna(selected_row['phone']) else ""
-                            cust_address_val = selected_row['address'] if pd.notna(selected_row['address']) else ""
-                        else: st.warning("لا يوجد")
-                    else:
-                        c_n = st.text_input("الاسم (حساب الانستغرام)")
-                        c_p = st.text_input("الهاتف")
-                        c_a = st.text_input("العنوان")
-                        cust_name_val = c_n
-                        cust_username_val = c_n
-                        cust_phone_val = c_p
-                        cust_address_val = c_a
+            st.divider()
+            st.markdown("##### 👤 بيانات العميل")
+            with st.container(border=True):
+                cust_type = st.radio("نوع العميل", ["جديد", "سابق"], horizontal=True)
+                cust_id_val, cust_name_val, cust_username_val, cust_phone_val, cust_address_val = None, "", "", "", ""
+                if cust_type == "سابق":
+                    c_q = st.text_input("🔍 الاسم أو الهاتف أو الحساب", key="cust_lookup")
+                    try:
+                        found = data.search_customers(c_q.strip())
+                    except Exception: found = pd.DataFrame()
+                    
+                    if not found.empty:
+                        custs = {int(x['id']): x for x in found.to_dict('records')}
+                        c_sel = st.selectbox(
+                            "الاسم:", list(custs),
+                            format_func=lambda i: f"{custs[i]['name']} - {custs[i]['phone']}"
+                        )
+                        selected_row = custs[c_sel]
+                        cust_id_val = c_sel
+                        cust_name_val = selected_row['name']
+                        cust_username_val = selected_row['username'] if pd.notna(selected_row['username']) else ""
+                        cust_phone_val = selected_row['phone'] if pd.notna(selected_row['phone']) else ""
+                        cust_address_val = selected_row['address'] if pd.notna(selected_row['address']) else ""
+                    else: st.warning("لا يوجد")
+                else:
+                    c_n = st.text_input("الاسم (حساب الانستغرام)")
+                    c_p = st.text_input("الهاتف")
+                    c_a = st.text_input("العنوان")
+                    cust_name_val = c_n
+                    cust_username_val = c_n
+                    cust_phone_val = c_p
+                    cust_address_val = c_a
+                    if len(c_p) == 11:
+                        try: known = data.customer_by_phone(c_p)
+                        except Exception: known = None
+                        if known:
+                            st.info(f"📞 الرقم مسجل باسم {known['name']}، سيُربط الطلب به")
+            
+
+            tot = sum(x['total'] for x in st.session_state.cart)
+            
+            # --- خيار مدة التوصيل ---
+            delivery_options = ["24 ساعة", "48 ساعة", "3 ايام", "4 ايام", "5 ايام", "6 ايام", "7 ايام"]
+            delivery_duration = st.selectbox("مدة التوصيل", delivery_options, index=1) # Default to 48 hours
+            
+            invoice_msg = "🌸 تم تثبيت طلبج بنجاح حبيبتي\n📄 تفاصيل الطلب:\n"
+            for i, x in enumerate(st.session_state.cart):
+                invoice_msg += f"القطعة: {x['name']}\n"
+                invoice_msg += f"اللون: {x['color']} | القياس: {x['size']}\n"
+                invoice_msg += f"العدد: {x['qty']}\n"
+                invoice_msg += f"السعر: {x['price']:,.0f}\n"
+                if len(st.session_state.cart) > 1 and i < len(st.session_state.cart) - 1:
+                    invoice_msg += "---\n"
+            
+            invoice_msg += f"التوصيل: مجاني 🎁\n"
+            invoice_msg += f"المجموع الكلي: {tot:,.0f} د.ع\n"
+            invoice_msg += f"📍 معلومات التوصيل:\n"
+            invoice_msg += f"العنوان: {cust_address_val}\n"
+            invoice_msg += f"الرقم: {cust_phone_val}\n"
+            invoice_msg += f"✨ ملاحظة مهمة: من يوصل المندوب، ضروري تفتحين الطلب وتقيسين القطعة وتتأكدين منها قبل الدفع. هذا حقج حتى تضمنين قياسج وموديلج 100%.\n"
+            invoice_msg += f"🚚 مدة التوصيل: خلال {delivery_duration} إن شاء الله. المندوب راح يتصل بيج قبل ما يوصل.\n\n"
+            invoice_msg += f"تتهنين بيها مقدماً، وشكراً لثقتج بـ نواعم بوتيك 🤍"
+            
+            st.markdown(f"""
+            <div style="background-color: var(--input-bg); padding: 15px; border-radius: 12px; text-align: center; margin-bottom: 20px; border: 1px solid var(--border-color);">
+                <div style="font-size: 0.9em; color: var(--subtext-color);">المجموع الكلي</div>
+                <div style="font-size: 1.8em; font-weight: bold; color: var(--primary-color);">{tot:,.0f} د.ع</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+            if st.button("✅ إتمام البيع", type="primary"):
+                if not cust_name_val: st.error("الاسم مطلوب!"); st.stop()
+
+                # التحقق من صحة رقم الهاتف (Validation)
+                if cust_type == "جديد":
+                    if not cust_phone_val.isdigit() or len(cust_phone_val) != 11 or not cust_phone_val.startswith("07"):
+                        st.error("رقم الهاتف غير صحيح: يجب أن يتكون من 11 رقماً ويبدأ بـ 07")
+                        st.stop()
                 
+                try:
+                    # التقاط وقت بغداد ككائن datetime
+                    baghdad_now = get_baghdad_time()
+                    # حذف التوقيت لتجنب مشاكل الـ offset في بعض مكتبات الـ DB إذا لم تكن configured
+                    # لكن psycopg2 يتعامل معها جيداً، سنرسل الـ datetime object
+                    inv_id = baghdad_now.strftime("%Y%m%d%H%M")
+                    
+                    local_journal = journal.get_journal()
+                    if local_journal is not None:
+                        # وضع السجل المحلي: يُحفظ الطلب على الجهاز ويُرسل لقاعدة البيانات في الخلفية
+                        new_customer = {"name": c_n, "phone": c_p, "address": c_a, "username": c_n} if cust_type == "جديد" else None
+                        local_journal.record_checked(cust_id_val, new_customer, st.session_state.cart, baghdad_now, inv_id, delivery_duration)
+                    else:
+                        with db.transaction() as cur:
+                            if cust_type == "جديد":
+                                cust_id_val = checkout.find_or_create_customer(cur, c_n, c_p, c_a, c_n)
+                            
+                            # خصم المخزون وإدخال كل الأسطر دفعة واحدة (يفشل كاملاً إذا نقص أي صنف)
+                            checkout.place_order(cur, cust_id_val, st.session_state.cart, baghdad_now, inv_id, delivery_duration)
+                        data.invalidate("variants", "sales", "customers")
+                    
+                    st.toast(f"💰 تمت عملية البيع بقيمة {tot:,.0f} د.ع", icon="✅")
+                    st.session_state.cart = []
+                    st.session_state.sale_success = True
+                    st.session_state.last_invoice_text = invoice_msg
+                    st.session_state.last_customer_username = cust_username_val
+                    st.rerun()
+                except checkout.OutOfStock as e:
+                    data.invalidate("variants")
+                    st.error("⚠️ الكمية غير متوفرة، عدّلي السلة:")
+                    for line in e.short:
+                        st.caption(f"{line['name']} | {line['color']} ({line['size']}): المطلوب {line['requested']} - المتوفر {line['available']}")
+                except Exception as e:
+                    st.error(f"حدث خطأ: {e}")
+
+# === 2. السجل ===
+def log_filters():
+    """Filter widgets of the sales log; returns the keyword arguments for ``data.load_sales_page``."""
+    with st.expander("🔎 بحث في السجل"):
+        days = st.date_input("الفترة", value=(), format="YYYY-MM-DD", key="log_days")
+        c1, c2 = st.columns(2)
+        c_q = c1.text_input("🔍 الزبون (الاسم أو الهاتف)", key="log_customer_q")
+        try:
+            custs = data.search_customers(c_q.strip()) if c_q.strip() else pd.DataFrame()
+            cust_names = dict(zip(custs['id'].astype(int), custs['name'].fillna("") + " - " + custs['phone'].fillna("")))
+        except Exception: cust_names = {}
+        customer_id = c1.selectbox(
+            "الزبون", [None] + list(cust_names), key="log_customer",
+            format_func=lambda i: "الكل" if i is None else cust_names.get(i, str(i))
+        )
+        try: products = data.load_product_names()
+        except Exception: products = []
+        product = c2.selectbox("المنتج", [None] + products, key="log_product", format_func=lambda x: "الكل" if x is None else x)
+    days = tuple(days) if isinstance(days, (tuple, list)) else (days,)
+    return {
+        "day_from": days[0] if days else None,
+        "day_to": days[-1] if days else None,
+        "customer_id": customer_id,
+        "product": product,
+    }
+
 
-                tot = sum(x['total'] for x in st.session_state.cart)
+def log_section():
+    filters = log_filters()
+    # مؤشرات الصفحات السابقة (أصغر id في كل صفحة)؛ تُصفّر عند تغيير الفلاتر
+    if st.session_state.get('log_filters') != filters:
+        st.session_state.log_filters = filters
+        st.session_state.log_cursors = []
+    cursors = st.session_state.log_cursors
+    before_id = cursors[-1] if cursors else None
+    st.caption("آخر العمليات" if before_id is None else f"عمليات أقدم (صفحة {len(cursors) + 1})")
+    try:
+        df_s, has_more = data.load_sales_page(before_id=before_id, **filters)
+        if df_s.empty:
+            st.info("لا توجد مبيعات بعد" if not cursors and not any(filters.values()) else "لا توجد نتائج")
+        profiler.mark("قائمة المبيعات")
+        for i, r in df_s.iterrows():
+            with st.container(border=True):
+                c1, c2 = st.columns([4,1])
+                c_name = r['customer_name'] if r['customer_name'] else "غير مسجل"
                 
-                # --- خيار مدة التوصيل ---
-                delivery_options = ["24 ساعة", "48 ساعة", "3 ايام", "4 ايام", "5 ايام", "6 ايام", "7 ايام"]
-                delivery_duration = st.selectbox("مدة التوصيل", delivery_options, index=1) # Default to 48 hours
+                details = ""
+                if pd.notna(r['color']) and pd.notna(r['size']):
+                    details = f" | 🎨 {r['color']} - {r['size']}"
                 
-                invoice_msg = "🌸 تم تثبيت طلبج بنجاح حبيبتي\n📄 تفاصيل الطلب:\n"
-                for i, x in enumerate(st.session_state.cart):
-                    invoice_msg += f"القطعة: {x['name']}\n"
-                    invoice_msg += f"اللون: {x['color']} | القياس: {x['size']}\n"
-                    invoice_msg += f"العدد: {x['qty']}\n"
-                    invoice_msg += f"السعر: {x['price']:,.0f}\n"
-                    if len(st.session_state.cart) > 1 and i < len(st.session_state.cart) - 1:
-                        invoice_msg += "---\n"
+                # معالجة عرض التاريخ (Timestamp)
+                date_display = r['date'].strftime('%Y-%m-%d %I:%M %p') if pd.notnull(r['date']) else ""
                 
-                invoice_msg += f"التوصيل: مجاني 🎁\n"
-                invoice_msg += f"المجموع الكلي: {tot:,.0f} د.ع\n"
-                invoice_msg += f"📍 معلومات التوصيل:\n"
-                invoice_msg += f"العنوان: {cust_address_val}\n"
-                invoice_msg += f"الرقم: {cust_phone_val}\n"
-                invoice_msg += f"✨ ملاحظة مهمة: من يوصل المندوب، ضروري تفتحين الطلب وتقيسين القطعة وتتأكدين منها قبل الدفع. هذا حقج حتى تضمنين قياسج وموديلج 100%.\n"
-                invoice_msg += f"🚚 مدة التوصيل: خلال {delivery_duration} إن شاء الله. المندوب راح يتصل بيج قبل ما يوصل.\n\n"
-                invoice_msg += f"تتهنين بيها مقدماً، وشكراً لثقتج بـ نواعم بوتيك 🤍"
+                c1.markdown(f"**{r['product_name']}** ({r['qty']})")
+                c1.caption(f"👤 {c_name} | 💰 {r['total']:,.0f}{details}")
+                c1.caption(f"📅 {date_display}")
                 
-                st.markdown(f"""
-                <div style="background-color: var(--input-bg); padding: 15px; border-radius: 12px; text-align: center; margin-bottom: 20px; border: 1px solid var(--border-color);">
-                    <div style="font-size: 0.9em; color: var(--subtext-color);">المجموع الكلي</div>
-                    <div style="font-size: 1.8em; font-weight: bold; color: var(--primary-color);">{tot:,.0f} د.ع</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-                if st.button("✅ إتمام البيع", type="primary"):
-                    if not cust_name_val: st.error("الاسم مطلوب!"); st.stop()
-
-                    # التحقق من صحة رقم الهاتف (Validation)
-                    if cust_type == "جديد":
-                        if not cust_phone_val.isdigit() or len(cust_phone_val) != 11 or not cust_phone_val.startswith("07"):
-                            st.error("رقم الهاتف غير صحيح: يجب أن يتكون من 11 رقماً ويبدأ بـ 07")
-                            st.stop()
-                    
+                # Buttons
+                if c2.button("⚙️", key=f"e{r['id']}"): 
+                    edit_sale_dialog(r['id'], r['qty'], r['total'], r['variant_id'], r['product_name'])
+                
+                if c2.button("↩️", key=f"ret{r['id']}", help="إضافة للرواجع"):
                     try:
-                        with conn.cursor() as cur:
-                            if cust_type == "جديد":
-                                cur.execute("INSERT INTO public.customers (name, phone, address, username) VALUES (%s,%s,%s,%s) RETURNING id", (c_n, c_p, c_a, c_n))
-                                cust_id_val = cur.fetchone()[0]
-                            
-                            # التقاط وقت بغداد ككائن datetime
-                            baghdad_now = get_baghdad_time()
-                            # حذف التوقيت لتجنب مشاكل الـ offset في بعض مكتبات الـ DB إذا لم تكن configured
-                            # لكن psycopg2 يتعامل معها جيداً، سنرسل الـ datetime object
-                            inv_id = baghdad_now.strftime("%Y%m%d%H%M")
-                            
-                            for x in st.session_state.cart:
-                                cur.execute("UPDATE public.variants SET stock=stock-%s WHERE id=%s", (int(x['qty']), int(x['id'])))
-                                profit_calc = (x['price'] - x['cost']) * x['qty']
+                        with db.transaction() as cur:
+                            # Check duplicates
+                            cur.execute("SELECT id FROM public.returns WHERE sale_id=%s", (int(r['id']),))
+                            duplicate = cur.fetchone() is not None
+                            if not duplicate:
                                 cur.execute("""
-                                    INSERT INTO public.sales (customer_id, variant_id, product_name, qty, total, profit, date, invoice_id, delivery_duration) 
-                                    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                                """, (int(cust_id_val), int(x['id']), x['name'], int(x['qty']), float(x['total']), float(profit_calc), baghdad_now, inv_id, delivery_duration))
-                            
-                            conn.commit()
-                            st.toast(f"💰 تمت عملية البيع بقيمة {tot:,.0f} د.ع", icon="✅")
-                            st.session_state.cart = []
-                            st.session_state.sale_success = True
-                            st.session_state.last_invoice_text = invoice_msg
-                            st.session_state.last_customer_username = cust_username_val
-                            st.cache_data.clear(); st.rerun()
+                                    INSERT INTO public.returns (
+                                        sale_id, variant_id, customer_id, product_name, 
+                                        product_details, qty, return_amount, return_date, status
+                                    )
+                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'Pending')
+                                """, (
+                                    int(r['id']), 
+                                    int(r['variant_id']) if pd.notna(r['variant_id']) else None,
+                                    int(r['customer_id']) if pd.notna(r['customer_id']) else None,
+                                    r['product_name'],
+                                    details.replace(" | ", "").strip(),
+                                    int(r['qty']),
+                                    float(r['total']),
+                                    get_baghdad_time()
+                                ))
+                        if duplicate:
+                            st.toast("⚠️ تم طلب إرجاع هذا العنصر مسبقاً", icon="⚠️")
+                        else:
+                            data.invalidate("returns")
+                            st.toast("✅ تمت الإضافة لقائمة الرواجع", icon="↩️")
                     except Exception as e:
-                        conn.rollback()
                         st.error(f"حدث خطأ: {e}")
 
-    # === 2. السجل ===
-    with tabs[1]:
-        st.caption("آخر العمليات")
-        try:
-            df_s = pd.read_sql("""
-                SELECT s.*, c.name as customer_name, v.color, v.size 
-                FROM public.sales s 
-                LEFT JOIN public.customers c ON s.customer_id = c.id 
-                LEFT JOIN public.variants v ON s.variant_id = v.id 
-                ORDER BY s.id DESC LIMIT 30
-            """, conn)
-            for i, r in df_s.iterrows():
+        c_new, c_old = st.columns(2)
+        if cursors and c_new.button("⬅️ أحدث", use_container_width=True):
+            cursors.pop(); st.rerun()
+        if has_more and c_old.button("تحميل الأقدم ➡️", use_container_width=True):
+            cursors.append(int(df_s['id'].min())); st.rerun()
+    except Exception: st.info("لا توجد مبيعات بعد")
+
+# === 3. الرواجع ===
+def returns_section():
+    st.subheader("🔙 إدارة المرجوعات")
+    try:
+        # عرض الطلبات المعلقة (Pending)
+        pending_returns = data.load_pending_returns()
+        
+        if not pending_returns.empty:
+            for i, row in pending_returns.iterrows():
                 with st.container(border=True):
-                    c1, c2 = st.columns([4,1])
-                    c_name = r['customer_name'] if r['customer_name'] else "غير مسجل"
-                    
-                    details = ""
-                    if pd.notna(r['color']) and pd.notna(r['size']):
-                        details = f" | 🎨 {r['color']} - {r['size']}"
-                    
-                    # معالجة عرض التاريخ (Timestamp)
-                    date_display = r['date'].strftime('%Y-%m-%d %I:%M %p') if pd.notnull(r['date']) else ""
+                    c1, c2 = st.columns([4, 1])
                     
-                    c1.markdown(f"**{r['product_name']}** ({r['qty']})")
-                    c1.caption(f"👤 {c_name} | 💰 {r['total']:,.0f}{details}")
-                    c1.caption(f"📅 {date_display}")
+                    # تفاصيل الطلب
+                    c1.markdown(f"**{row['product_name']}**")
+                    c1.caption(f"📝 {row['product_details']} | 🔢 العدد: {row['qty']}")
+                    c1.caption(f"💰 مبلغ الاسترجاع: {row['return_amount']:,.0f} د.ع | 🆔 فاتورة: {row['sale_id']}")
                     
-                    # Buttons
-                    if c2.button("⚙️", key=f"e{r['id']}"): 
-                        edit_sale_dialog(r['id'], r['qty'], r['total'], r['variant_id'], r['product_name'])
-                    
-                    if c2.button("↩️", key=f"ret{r['id']}", help="إضافة للرواجع"):
+                    # زر الاستلام
+                    if c2.button("📥 استلام للمخزن", key=f"recv_{row['id']}"):
                         try:
-                            with conn.cursor() as cur:
-                                # Check duplicates
-                                cur.execute("SELECT id FROM public.returns WHERE sale_id=%s", (int(r['id']),))
-                                if cur.fetchone():
-                                    st.toast("⚠️ تم طلب إرجاع هذا العنصر مسبقاً", icon="⚠️")
-                                else:
-                                    cur.execute("""
-                                        INSERT INTO public.returns (
-                                            sale_id, variant_id, customer_id, product_name, 
-                                            product_details, qty, return_amount, return_date, status
-                                        )
-                                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'Pending')
-                                    """, (
-                                        int(r['id']), 
-                                        int(r['variant_id']) if pd.notna(r['variant_id']) else None,
-                                        int(r['customer_id']) if pd.notna(r['customer_id']) else None,
-                                        r['product_name'],
-                                        details.replace(" | ", "").strip(),
-                                        int(r['qty']),
-                                        float(r['total']),
-                                        get_baghdad_time()
-                                    ))
-                                    conn.commit()
-                                    st.toast("✅ تمت الإضافة لقائمة الرواجع", icon="↩️")
+                            with db.transaction() as cur:
+                                # 1. تحديث المخزون (إرجاع الكمية)
+                                if pd.notna(row['variant_id']):
+                                    cur.execute("UPDATE public.variants SET stock = stock + %s WHERE id = %s", 
+                                                (int(row['qty']), int(row['variant_id'])))
+                                
+                                # 2. تحديث حالة الإرجاع
+                                cur.execute("UPDATE public.returns SET status = 'Received' WHERE id = %s", (int(row['id']),))
+                                
+                                # 3. تسجيل مصروف (خصم المبلغ من الكاش)
+                                reason_txt = f"استرجاع: {row['product_name']} - فاتورة #{row['sale_id']}"
+                                dt_now = get_baghdad_time()
+                                cur.execute("INSERT INTO public.expenses (amount, reason, date) VALUES (%s, %s, %s)",
+                                            (float(row['return_amount']), reason_txt, dt_now))
+                                summary.expense_added(cur, dt_now, row['return_amount'])
+                            
+                            st.success("✅ تم استلام القطعة وإعادتها للمخزون بنجاح")
+                            st.toast("✅ العملية تمت بنجاح")
+                            data.invalidate("variants", "returns", "expenses"); st.rerun()
                         except Exception as e:
                             st.error(f"حدث خطأ: {e}")
-        except: st.info("لا توجد مبيعات بعد")
+        else:
+            st.info("🎉 لا توجد طلبات إرجاع معلقة حالياً")
+            
+    except Exception as e:
+        st.error(f"خطأ في جلب البيانات: {e}")
 
-    # === 3. الرواجع ===
-    with tabs[2]:
-        st.subheader("🔙 إدارة المرجوعات")
-        try:
-            # عرض الطلبات المعلقة (Pending)
-            pending_returns = pd.read_sql("SELECT * FROM public.returns WHERE status = 'Pending' ORDER BY id DESC", conn)
+# === 4. العملاء ===
+def customers_section():
+    try:
+        search_query = st.text_input("🔍 بحث عن عميل (الاسم أو الهاتف)", "").strip()
+        # مؤشرات الصفحات السابقة (مجموع الشراء و id آخر عميل)؛ تُصفّر عند تغيير البحث
+        if st.session_state.get('cust_search') != search_query:
+            st.session_state.cust_search = search_query
+            st.session_state.cust_cursors = []
+        cursors = st.session_state.cust_cursors
+        df_cust, has_more = data.load_customer_page(search_query, cursors[-1] if cursors else None)
+
+        if not df_cust.empty:
+            st.divider()
             
-            if not pending_returns.empty:
-                for i, row in pending_returns.iterrows():
+            profiler.mark("بطاقات العملاء")
+            col1, col2 = st.columns(2)
+            for i, r in df_cust.reset_index(drop=True).iterrows():
+                with (col1 if i % 2 == 0 else col2):
                     with st.container(border=True):
-                        c1, c2 = st.columns([4, 1])
+                        username_display = f"@{r['username']}" if r['username'] and r['username'] != r['name'] else ""
+                        phone_display = f"📞 {r['phone']}" if r['phone'] else ""
                         
-                        # تفاصيل الطلب
-                        c1.markdown(f"**{row['product_name']}**")
-                        c1.caption(f"📝 {row['product_details']} | 🔢 العدد: {row['qty']}")
-                        c1.caption(f"💰 مبلغ الاسترجاع: {row['return_amount']:,.0f} د.ع | 🆔 فاتورة: {row['sale_id']}")
-                        
-                        # زر الاستلام
-                        if c2.button("📥 استلام للمخزن", key=f"recv_{row['id']}"):
-                            try:
-                                with conn.cursor() as cur:
-                                    # 1. تحديث المخزون (إرجاع الكمية)
-                                    if row['variant_id']:
-                                        cur.execute("UPDATE public.variants SET stock = stock + %s WHERE id = %s", 
-                                                    (int(row['qty']), int(row['variant_id'])))
-                                    
-                                    # 2. تحديث حالة الإرجاع
-                                    cur.execute("UPDATE public.returns SET status = 'Received' WHERE id = %s", (int(row['id']),))
-                                    
-                                    # 3. تسجيل مصروف (خصم المبلغ من الكاش)
-                                    reason_txt = f"استرجاع: {row['product_name']} - فاتورة #{row['sale_id']}"
-                                    cur.execute("INSERT INTO public.expenses (amount, reason, date) VALUES (%s, %s, %s)",
-                                                (float(row['return_amount']), reason_txt, get_baghdad_time()))
-                                    
-                                    conn.commit()
-                                    st.success("✅ تم استلام القطعة وإعادتها للمخزون بنجاح")
-                                    st.toast("✅ العملية تمت بنجاح")
-                                    st.cache_data.clear(); st.rerun()
-                            except Exception as e:
-                                conn.rollback()
-                                st.error(f"حدث خطأ: {e}")
-            else:
-                st.info("🎉 لا توجد طلبات إرجاع معلقة حالياً")
-                
-        except Exception as e:
-            st.error(f"خطأ في جلب البيانات: {e}")
-
-    # === 4. العملاء ===
-    with tabs[3]:
-        try:
-            df_cust = pd.read_sql("""
-                SELECT 
-                    c.id, c.name, c.phone, c.username, c.address,
-                    COALESCE(SUM(s.total), 0) as total_spend,
-                    MAX(s.date) as last_purchase
-                FROM public.customers c
-                LEFT JOIN public.sales s ON c.id = s.customer_id
-                GROUP BY c.id, c.name, c.phone, c.username, c.address
-                ORDER BY total_spend DESC
-            """, conn)
-            
-            if not df_cust.empty:
-                search_query = st.text_input("🔍 بحث عن عميل (الاسم أو الهاتف)", "")
-                if search_query:
-                    mask = (
-                        df_cust['name'].str.contains(search_query, case=False) | 
-                        df_cust['phone'].str.contains(search_query, case=False) |
-                        df_cust['username'].str.contains(search_query, case=False)
-                    )
-                    df_cust = df_cust[mask]
-                
-                st.divider()
-                
-                col1, col2 = st.columns(2)
-                for i, r in df_cust.iterrows():
-                    with (col1 if i % 2 == 0 else col2):
-                        with st.container(border=True):
-                            username_display = f"@{r['username']}" if r['username'] and r['username'] != r['name'] else ""
-                            phone_display = f"📞 {r['phone']}" if r['phone'] else ""
-                            
-                            st.markdown(f"""
-                            <div style="direction: rtl; text-align: right;">
-                                <div style="font-weight: 800; font-size: 1.2em; color: var(--primary-color); margin-bottom: 4px;">
-                                    {r['name']}
-                                </div>
-                                <div style="font-size: 0.9em; color: var(--subtext-color); margin-bottom: 8px;">
-                                    {username_display} &nbsp; {phone_display}
-                                </div>
+                        st.markdown(f"""
+                        <div style="direction: rtl; text-align: right;">
+                            <div style="font-weight: 800; font-size: 1.2em; color: var(--primary-color); margin-bottom: 4px;">
+                                {r['name']}
                             </div>
-                            """, unsafe_allow_html=True)
-                            
-                            c_stat1, c_stat2 = st.columns(2)
-                            c_stat1.metric("مجموع الشراء", f"{r['total_spend']:,.0f}")
-                            if pd.notnull(r['last_purchase']):
-                                # تحويل Timestamp إلى نص
-                                last_date = r['last_purchase'].strftime('%Y-%m-%d')
-                                c_stat2.metric("آخر ظهور", last_date)
-                            else:
-                                c_stat2.caption("لم يشتري بعد")
-                                
-                            if r['address']:
-                                st.caption(f"📍 {r['address']}")
+                            <div style="font-size: 0.9em; color: var(--subtext-color); margin-bottom: 8px;">
+                                {username_display} &nbsp; {phone_display}
+                            </div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        
+                        c_stat1, c_stat2 = st.columns(2)
+                        c_stat1.metric("مجموع الشراء", f"{r['total_spend']:,.0f}")
+                        if pd.notnull(r['last_purchase']):
+                            # تحويل Timestamp إلى نص
+                            last_date = r['last_purchase'].strftime('%Y-%m-%d')
+                            c_stat2.metric("آخر ظهور", last_date)
+                            st.caption(f"🧾 {r['orders']} طلب")
+                        else:
+                            c_stat2.caption("لم يشتري بعد")
                             
-                            if r['phone']:
-                                wa_url = f"https://wa.me/{r['phone'].replace('+', '').replace(' ', '')}"
-                                st.link_button("💬 واتساب", wa_url)
-                                
-            else:
-                st.info("لا يوجد عملاء مسجلين حالياً")
-        except Exception as e:
-            st.error(f"حدث خطأ في عرض العملاء: {e}")
+                        if r['address']:
+                            st.caption(f"📍 {r['address']}")
+                        
+                        if r['phone']:
+                            wa_url = f"https://wa.me/{r['phone'].replace('+', '').replace(' ', '')}"
+                            st.link_button("💬 واتساب", wa_url)
 
-    # === 5. المخزون ===
-    with tabs[4]:
-        if 'last_added_msg' in st.session_state and st.session_state['last_added_msg']:
-            st.success(st.session_state['last_added_msg'])
-            st.session_state['last_added_msg'] = None
-        try:
-            df_inv = pd.read_sql("SELECT * FROM public.variants ORDER BY name", conn)
-            
-            total_items_count = df_inv['stock'].sum() if not df_inv.empty else 0
-            total_value_cost = (df_inv['stock'] * df_inv['cost']).sum() if not df_inv.empty else 0
-            total_value_sell = (df_inv['stock'] * df_inv['price']).sum() if not df_inv.empty else 0
-            total_potential_profit = total_value_sell - total_value_cost
-            low_stock_count = df_inv[df_inv['stock'] < 5].shape[0] if not df_inv.empty else 0
-
-            m1, m2, m3, m4 = st.columns(4)
-            m1.metric("📦 عدد القطع", f"{total_items_count}")
-            m2.metric("💰 قيمة المخزون (بيع)", f"{total_value_sell:,.0f}")
-            m3.metric("📉 نواقص (<5)", f"{low_stock_count}", delta_color="inverse")
-            m4.metric("💵 ربح متوقع", f"{total_potential_profit:,.0f}")
-            
-        except Exception as e:
-            st.error(f"خطأ في الحسابات: {e}")
-            df_inv = pd.DataFrame()
+            c_prev, c_next = st.columns(2)
+            if cursors and c_prev.button("⬅️ السابق", use_container_width=True):
+                cursors.pop(); st.rerun()
+            if has_more and c_next.button("التالي ➡️", use_container_width=True):
+                last = df_cust.iloc[-1]
+                cursors.append((float(last['total_spend']), int(last['id']))); st.rerun()
+        elif search_query:
+            st.info("لا توجد نتائج")
+        else:
+            st.info("لا يوجد عملاء مسجلين حالياً")
+    except Exception as e:
+        st.error(f"حدث خطأ في عرض العملاء: {e}")
 
-        st.divider()
+# === 5. المخزون ===
+INVENTORY_PAGE_SIZE = 20
 
-        c_ctrl1, c_ctrl2 = st.columns([3, 1])
-        with c_ctrl1:
-            search_query = st.text_input("🔍 بحث عن صنف (الاسم، اللون، القياس)...", label_visibility="collapsed")
-        with c_ctrl2:
-            with st.popover("➕ إضافة صنف جديد", use_container_width=True):
-                with st.form("add_new_stock"):
-                    st.markdown("##### إضافة بضاعة (Bulk & Smart)")
-                    nm = st.text_input("اسم المنتج")
-                    
-                    c_h1, c_h2 = st.columns(2)
-                    col_hint = "مثال: أحمر، أسود، أزرق"
-                    cl = c_h1.text_input("اللون/الألوان", help=col_hint, placeholder="أحمر، أسود")
-                    siz_hint = "مثال: S, M, L, XL (أو 38-40-42)"
-                    sz = c_h2.text_input("القياس/القياسات", help=siz_hint, placeholder="S, M, L")
-                    
-                    c_f1, c_f2, c_f3 = st.columns(3)
-                    stk = c_f1.number_input("العدد (للقطعة)", 1)
-                    pr = c_f2.number_input("سعر البيع", 0.0)
-                    cst = c_f3.number_input("سعر التكلفة", 0.0)
-                    
-                    if st.form_submit_button("حفظ وإضافة", type="primary"):
-                        if not nm or not cl or not sz:
-                            st.error("يرجى ملء الاسم واللون والقياس")
-                        else:
-                            try:
-                                # Prepare reference for Fuzzy Match
-                                existing_names = df_inv['name'].unique().tolist() if not df_inv.empty else []
-                                existing_colors = df_inv['color'].unique().tolist() if not df_inv.empty else []
-                                
-                                # 1. Name Fuzzy Match
-                                final_name = fuzzy_match(nm, existing_names)
-                                
-                                # 2. Parse Lists
-                                colors_list = parse_multi_input(cl)
-                                sizes_list = parse_multi_input(sz)
-                                
-                                # Cartesian Product
-                                combinations = list(itertools.product(colors_list, sizes_list))
-                                
-                                count_added = 0
-                                count_updated = 0
-                                
-                                with conn.cursor() as cur:
-                                    for c_val, s_val in combinations:
-                                        # 3. Color Fuzzy Match
-                                        final_color = fuzzy_match(c_val, existing_colors)
-                                        
-                                        # Check existence
-                                        cur.execute(
-                                            "SELECT id, stock FROM public.variants WHERE name=%s AND color=%s AND size=%s",
-                                            (final_name, final_color, s_val)
-                                        )
-                                        res = cur.fetchone()
-                                        
-                                        if res:
-                                            # Update Existing
-                                            cur.execute(
-                                                "UPDATE public.variants SET stock = stock + %s, price = %s, cost = %s WHERE id = %s",
-                                                (int(stk), float(pr), float(cst), res[0])
-                                            )
-                                            count_updated += 1
-                                        else:
-                                            # Insert New
-                                            cur.execute(
-                                                "INSERT INTO public.variants (name,color,size,stock,price,cost) VALUES (%s,%s,%s,%s,%s,%s)", 
-                                                (final_name, final_color, s_val, int(stk), float(pr), float(cst))
-                                            )
-                                            count_added += 1
-                                            
-                                    conn.commit()
-                                    
-                                msg = f"✅ تمت العملية!\n📝 الاسم المعتمد: {final_name}\n➕ جديد: {count_added} | 🔄 تحديث: {count_updated}\n🎨 الألوان: {', '.join(colors_list)}"
-                                st.success(msg)
-                                st.toast(f"تمت إضافة/تحديث {len(combinations)} صنف", icon="🛍️")
-                                st.balloons()
-                                st.session_state['last_added_msg'] = msg 
-                                st.cache_data.clear(); st.rerun()
-                                
-                            except Exception as e:
-                                st.error(f"خطأ: {e}")
 
-        if not df_inv.empty:
-            # --- Strict Filter: Only show items with stock > 0 ---
-            # This ensures items with 0 stock (or negative) are completely hidden from the display.
-            df_display = df_inv[df_inv['stock'] > 0].copy()
-            
-            if search_query:
-                mask = (
-                    df_display['name'].str.contains(search_query, case=False) | 
-                    df_display['color'].str.contains(search_query, case=False) |
-                    df_display['size'].str.contains(search_query, case=False)
-                )
-                df_display = df_display[mask]
-            
-            if not df_display.empty:
-                unique_products = df_display['name'].unique()
-                for p_name in unique_products:
-                    p_group = df_display[df_display['name'] == p_name]
-                    total_qty = p_group['stock'].sum()
-                    
-                    # Expander for Product
-                    with st.expander(f"{p_name} (العدد: {total_qty})"):
-                        
-                        unique_colors = p_group['color'].unique()
-                        for color in unique_colors:
-                            c_group = p_group[p_group['color'] == color]
-                            color_qty = c_group['stock'].sum()
-                            
-                            # Skip if no stock (Strict visual cleanup)
-                            if color_qty <= 0: continue
+def render_product_stock(product):
+    """Color rows with size chips for one node of ``data.inventory_tree``."""
+    for c in product['colors']:
+        color, color_qty = c['color'], c['total']
+
+        # Layout: Color Info (Left) | Size Chips (Right)
+        col_info, col_chips = st.columns([1, 3])
+        
+        # Left Column: Color Dot + Name
+        hex_code = get_color_hex(color)
+        border_style = "border: 1px solid #555;" if hex_code == "#000000" else ""
+        
+        with col_info:
+            st.markdown(f"""
+            <div style="display: flex; align-items: center; gap: 8px;">
+                <div style="width: 16px; height: 16px; border-radius: 50%; background-color: {hex_code}; {border_style}"></div>
+                <div style="font-weight: bold; font-size: 1em;">{color} <span style="font-weight: normal; color: var(--subtext-color); font-size: 0.9em;">({color_qty})</span></div>
+            </div>
+            """, unsafe_allow_html=True)
+
+        # Right Column: Size Chips (القياسات مرتبة مسبقاً في الشجرة)
+        with col_chips:
+            chips_html = '<div style="display: flex; gap: 6px; flex-wrap: wrap;">'
+            for size_val, qty_val in c['sizes']:
+                # Chip Style (Single line to avoid Markdown code block trigger)
+                chips_html += f"""<div style="border: 1px solid #3A3A3C; border-radius: 12px; padding: 2px 10px; margin: 2px; font-size: 0.85em; background-color: #2C2C2E; color: #FFF; display: flex; align-items: center; gap: 4px;"><span style="font-weight: bold;">{size_val}</span><span style="font-size: 0.9em; opacity: 0.7; color: #FFD60A;">(x{qty_val})</span></div>"""
+            chips_html += "</div>"
+            st.markdown(chips_html, unsafe_allow_html=True)
+        
+        st.markdown("<div style='margin-bottom: 8px;'></div>", unsafe_allow_html=True) # Spacer
+
+    st.divider()
+    if st.button("✏️ تعديل الكميات", key=f"edit_stk_{hash(product['name'])}"):
+        edit_product_stock_dialog(product['name'])
 
-                            # Layout: Color Info (Left) | Size Chips (Right)
-                            col_info, col_chips = st.columns([1, 3])
+
+def catalog_import_panel():
+    """Supplier sheet -> staged preview -> one merge into ``public.variants``."""
+    with st.expander("📥 استيراد أصناف من ملف (CSV / Excel)"):
+        st.caption("الأعمدة: المنتج، اللون، القياس، العدد، التكلفة، سعر البيع (يمكن كتابة عدة ألوان أو قياسات في خانة واحدة)")
+        # مفتاح جديد بعد كل استيراد ناجح يفرغ رافع الملفات
+        upload = st.file_uploader(
+            "ملف المورد", type=["csv", "xlsx"], label_visibility="collapsed",
+            key=f"catalog_file_{st.session_state.get('catalog_round', 0)}"
+        )
+        if upload is None:
+            st.session_state.pop('catalog_import', None); return
+        # التحليل والمطابقة مرة واحدة لكل ملف، لا مع كل rerun
+        state = st.session_state.get('catalog_import')
+        if state is None or state['file_id'] != upload.file_id:
+            try:
+                sheet = catalog_import.read_sheet(upload.getvalue(), upload.name)
+                names, colors = data.catalog_matchers()
+                rows, renames, problems = catalog_import.prepare(sheet, names, colors)
+                with db.transaction() as cur:
+                    catalog_import.stage(cur, rows)
+                    diff = catalog_import.preview(cur)
+            except Exception as e:
+                st.error(f"تعذرت قراءة الملف: {e}"); return
+            state = {"file_id": upload.file_id, "rows": rows, "renames": renames, "problems": problems, "diff": diff}
+            st.session_state.catalog_import = state
+        diff = state['diff']
+        new_count = int(diff['new'].sum()) if not diff.empty else 0
+        m1, m2, m3 = st.columns(3)
+        m1.metric("➕ أصناف جديدة", new_count)
+        m2.metric("🔄 تحديث موجود", len(diff) - new_count)
+        m3.metric("⚠️ أسطر متروكة", len(state['problems']))
+        if state['renames']:
+            st.markdown("##### توحيد الكتابة")
+            st.dataframe(pd.DataFrame(
+                [(v, final) for (_, v), final in state['renames'].items()], columns=["في الملف", "المعتمد"]
+            ), hide_index=True, use_container_width=True)
+        if state['problems']:
+            st.dataframe(pd.DataFrame(state['problems'], columns=["السطر", "المشكلة"]), hide_index=True, use_container_width=True)
+        st.dataframe(diff, hide_index=True, use_container_width=True)
+        if not diff.empty and st.button(f"✅ اعتماد الاستيراد ({len(diff)} صنف)", type="primary", key="catalog_apply"):
+            try:
+                with db.transaction() as cur:
+                    catalog_import.stage(cur, state['rows'])
+                    added, updated = catalog_import.merge(cur)
+                st.session_state['last_added_msg'] = f"✅ تم الاستيراد: ➕ جديد {added} | 🔄 تحديث {updated}"
+                st.session_state.pop('catalog_import', None)
+                st.session_state.catalog_round = st.session_state.get('catalog_round', 0) + 1
+                data.invalidate("variants"); st.rerun()
+            except Exception as e:
+                st.error(f"خطأ: {e}")
+
+
+def inventory_section():
+    if 'last_added_msg' in st.session_state and st.session_state['last_added_msg']:
+        st.success(st.session_state['last_added_msg'])
+        st.session_state['last_added_msg'] = None
+    try:
+        # المجاميع باستعلام تجميعي واحد بدل تحميل كل الأصناف
+        totals = data.inventory_totals()
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("📦 عدد القطع", f"{totals['pieces']}")
+        m2.metric("💰 قيمة المخزون (بيع)", f"{totals['sell_value']:,.0f}")
+        m3.metric("📉 نواقص (<5)", f"{totals['low_stock']}", delta_color="inverse")
+        m4.metric("💵 ربح متوقع", f"{totals['sell_value'] - totals['cost_value']:,.0f}")
+        
+    except Exception as e:
+        st.error(f"خطأ في الحسابات: {e}")
+        totals = {"variants": 0}
+
+    profiler.mark("البحث والإضافة")
+    st.divider()
+
+    c_ctrl1, c_ctrl2 = st.columns([3, 1])
+    with c_ctrl1:
+        search_query = st.text_input("🔍 بحث عن صنف (الاسم، اللون، القياس)...", label_visibility="collapsed")
+    with c_ctrl2:
+        with st.popover("➕ إضافة صنف جديد", use_container_width=True):
+            with st.form("add_new_stock"):
+                st.markdown("##### إضافة بضاعة (Bulk & Smart)")
+                nm = st.text_input("اسم المنتج")
+                
+                c_h1, c_h2 = st.columns(2)
+                col_hint = "مثال: أحمر، أسود، أزرق"
+                cl = c_h1.text_input("اللون/الألوان", help=col_hint, placeholder="أحمر، أسود")
+                siz_hint = "مثال: S, M, L, XL (أو 38-40-42)"
+                sz = c_h2.text_input("القياس/القياسات", help=siz_hint, placeholder="S, M, L")
+                
+                c_f1, c_f2, c_f3 = st.columns(3)
+                stk = c_f1.number_input("العدد (للقطعة)", 1)
+                pr = c_f2.number_input("سعر البيع", 0.0)
+                cst = c_f3.number_input("سعر التكلفة", 0.0)
+                
+                if st.form_submit_button("حفظ وإضافة", type="primary"):
+                    if not nm or not cl or not sz:
+                        st.error("يرجى ملء الاسم واللون والقياس")
+                    else:
+                        try:
+                            # Prepare reference for Fuzzy Match (فهرس مبني مرة واحدة لكل نسخة من المخزون)
+                            existing_names, existing_colors = data.catalog_matchers()
                             
-                            # Left Column: Color Dot + Name
-                            hex_code = get_color_hex(color)
-                            border_style = "border: 1px solid #555;" if hex_code == "#000000" else ""
+                            # 1. Name Fuzzy Match
+                            final_name = fuzzy_match(nm, existing_names)
                             
-                            with col_info:
-                                st.markdown(f"""
-                                <div style="display: flex; align-items: center; gap: 8px;">
-                                    <div style="width: 16px; height: 16px; border-radius: 50%; background-color: {hex_code}; {border_style}"></div>
-                                    <div style="font-weight: bold; font-size: 1em;">{color} <span style="font-weight: normal; color: var(--subtext-color); font-size: 0.9em;">({color_qty})</span></div>
-                                </div>
-                                """, unsafe_allow_html=True)
-
-                            # Right Column: Size Chips
-                            with col_chips:
-                                chips_html = '<div style="display: flex; gap: 6px; flex-wrap: wrap;">'
-                                # Sort sizes
-                                sizes_list = sorted(c_group['size'].astype(str).tolist())
-                                
-                                for size_val in sizes_list:
-                                    # Get qty for this specific variant (size)
-                                    # Since c_group is filtered by color, we filter by size
-                                    size_row = c_group[c_group['size'] == size_val]
-                                    if size_row.empty: continue
-                                    qty_val = size_row['stock'].sum()
-                                    if qty_val <= 0: continue # Strict hide for size
-                                    
-                                    # Chip Style (Single line to avoid Markdown code block trigger)
-                                    chips_html += f"""<div style="border: 1px solid #3A3A3C; border-radius: 12px; padding: 2px 10px; margin: 2px; font-size: 0.85em; background-color: #2C2C2E; color: #FFF; display: flex; align-items: center; gap: 4px;"><span style="font-weight: bold;">{size_val}</span><span style="font-size: 0.9em; opacity: 0.7; color: #FFD60A;">(x{qty_val})</span></div>"""
+                            # 2. Parse Lists
+                            colors_list = parse_multi_input(cl)
+                            sizes_list = parse_multi_input(sz)
+                            
+                            # 3. Color Fuzzy Match (مرة واحدة لكل لون)
+                            final_colors = {c_val: fuzzy_match(c_val, existing_colors) for c_val in colors_list}
+                            
+                            # Cartesian Product
+                            combinations = list(itertools.product(colors_list, sizes_list))
+                            rows = [
+                                (final_name, final_colors[c_val], s_val, int(stk), float(pr), float(cst))
+                                for c_val, s_val in combinations
+                            ]
+                            
+                            # إدخال/تحديث كل المصفوفة باستعلام واحد
+                            with db.transaction() as cur:
+                                count_added, count_updated = inventory.upsert_variants(cur, rows)
                                 
-                                chips_html += "</div>"
-                                st.markdown(chips_html, unsafe_allow_html=True)
+                            msg = f"✅ تمت العملية!\n📝 الاسم المعتمد: {final_name}\n➕ جديد: {count_added} | 🔄 تحديث: {count_updated}\n🎨 الألوان: {', '.join(colors_list)}"
+                            st.success(msg)
+                            st.toast(f"تمت إضافة/تحديث {len(combinations)} صنف", icon="🛍️")
+                            st.balloons()
+                            st.session_state['last_added_msg'] = msg 
+                            data.invalidate("variants"); st.rerun()
                             
-                            st.markdown("<div style='margin-bottom: 8px;'></div>", unsafe_allow_html=True) # Spacer
+                        except Exception as e:
+                            st.error(f"خطأ: {e}")
 
-                        st.divider()
-                        if st.button("✏️ تعديل الكميات", key=f"edit_stk_{hash(p_name)}"):
-                            edit_product_stock_dialog(p_name)
-            else:
-                st.info("لا توجد منتجات مطابقة للبحث (المتوفرة فقط).")
-        else:
-            st.info("المخزون فارغ، أضيفي منتجات جديدة.")
+    catalog_import_panel()
 
-    # === 6. المصاريف ===
-    with tabs[5]:
-        st.header("💸 إدارة المصاريف")
+    profiler.mark("قائمة المنتجات")
+    if totals['variants']:
+        # شجرة منتج ← لون ← قياس مبنية مرة واحدة لكل نسخة من المخزون (المتوفر فقط)
+        try: tree = data.inventory_tree(search_query.strip())
+        except Exception as e:
+            st.error(f"خطأ: {e}"); tree = []
         
-        with st.form("add_expense_form"):
-            c1, c2 = st.columns([1, 3])
-            amount = c1.number_input("المبلغ (د.ع)", min_value=1.0, step=250.0)
-            reason = c2.text_input("سبب الصرف / التفاصيل")
+        if tree:
+            # صفحة المنتجات تُصفّر عند تغيير البحث
+            if st.session_state.get('inv_search') != search_query:
+                st.session_state.inv_search = search_query
+                st.session_state.inv_page = 0
+            pages = (len(tree) - 1) // INVENTORY_PAGE_SIZE + 1
+            page = min(st.session_state.inv_page, pages - 1)
+            for product in tree[page * INVENTORY_PAGE_SIZE:(page + 1) * INVENTORY_PAGE_SIZE]:
+                p_name = product['name']
+                with st.container(border=True):
+                    # الرقائق تُبنى فقط للمنتج المفتوح
+                    if st.toggle(f"{p_name} (العدد: {product['total']})", key=f"inv_open_{hash(p_name)}"):
+                        render_product_stock(product)
             
-            if st.form_submit_button("➕ تسجيل مصروف"):
-                if reason and amount > 0:
-                    try:
-                        with conn.cursor() as cur:
-                            # إرسال datetime object بدلاً من النص
-                            dt_now = get_baghdad_time()
-                            cur.execute("INSERT INTO public.expenses (amount, reason, date) VALUES (%s, %s, %s)", (float(amount), reason, dt_now))
-                            conn.commit()
-                        st.toast(f"✅ تم تسجيل مصروف: {amount:,.0f} د.ع")
-                        st.success(f"تم تسجيل مصروف: {amount:,.0f} - {reason}")
-                        st.cache_data.clear(); st.rerun()
-                    except Exception as e:
-                        conn.rollback()
-                        st.error(f"حدث خطأ: {e}")
-                else:
-                    st.error("يرجى إدخال المبلغ والسبب")
-        
-        st.divider()
-        st.subheader("📋 سجل المصاريف (آخر 50)")
+            if pages > 1:
+                c_prev, c_page, c_next = st.columns([1, 2, 1])
+                if page > 0 and c_prev.button("⬅️ السابق", key="inv_prev", use_container_width=True):
+                    st.session_state.inv_page = page - 1; st.rerun()
+                c_page.caption(f"صفحة {page + 1} من {pages} ({len(tree)} منتج)")
+                if page < pages - 1 and c_next.button("التالي ➡️", key="inv_next", use_container_width=True):
+                    st.session_state.inv_page = page + 1; st.rerun()
+        else:
+            st.info("لا توجد منتجات مطابقة للبحث (المتوفرة فقط).")
+    else:
+        st.info("المخزون فارغ، أضيفي منتجات جديدة.")
+
+# === 6. المصاريف ===
+def expenses_section():
+    st.header("💸 إدارة المصاريف")
+    
+    with st.form("add_expense_form"):
+        c1, c2 = st.columns([1, 3])
+        amount = c1.number_input("المبلغ (د.ع)", min_value=1.0, step=250.0)
+        reason = c2.text_input("سبب الصرف / التفاصيل")
         
-        try:
-            df_exp = pd.read_sql("SELECT * FROM public.expenses ORDER BY id DESC LIMIT 50", conn)
-            if not df_exp.empty:
-                for i, row in df_exp.iterrows():
-                    with st.container(border=True):
-                        c_ex1, c_ex2, c_ex3 = st.columns([1, 3, 1])
-                        c_ex1.markdown(f"**{row['amount']:,.0f} د.ع**")
-                        c_ex2.markdown(f"{row['reason']}")
-                        # تنسيق التاريخ
-                        exp_date = row['date'].strftime('%Y-%m-%d') if pd.notnull(row['date']) else ""
-                        c_ex3.caption(f"{exp_date}")
-                        
-                        if c_ex3.button("🗑️", key=f"del_exp_{row['id']}"):
-                            try:
-                                with conn.cursor() as cur:
-                                    cur.execute("DELETE FROM public.expenses WHERE id = %s", (int(row['id']),))
-                                    conn.commit()
-                                    st.toast("🗑️ تم حذف المصروف")
-                                    st.cache_data.clear(); st.rerun()
-                            except: conn.rollback()
+        if st.form_submit_button("➕ تسجيل مصروف"):
+            if reason and amount > 0:
+                try:
+                    with db.transaction() as cur:
+                        # إرسال datetime object بدلاً من النص
+                        dt_now = get_baghdad_time()
+                        cur.execute("INSERT INTO public.expenses (amount, reason, date) VALUES (%s, %s, %s)", (float(amount), reason, dt_now))
+                        summary.expense_added(cur, dt_now, amount)
+                    st.toast(f"✅ تم تسجيل مصروف: {amount:,.0f} د.ع")
+                    st.success(f"تم تسجيل مصروف: {amount:,.0f} - {reason}")
+                    data.invalidate("expenses"); st.rerun()
+                except Exception as e:
+                    st.error(f"حدث خطأ: {e}")
             else:
-                st.info("لا توجد مصاريف مسجلة")
-        except:
-            st.info("لا توجد مصاريف بعد")
+                st.error("يرجى إدخال المبلغ والسبب")
+    
+    st.divider()
+    profiler.mark("سجل المصاريف")
+    st.subheader("📋 سجل المصاريف (آخر 50)")
+    
+    try:
+        df_exp = data.load_recent_expenses(50)
+        if not df_exp.empty:
+            for i, row in df_exp.iterrows():
+                with st.container(border=True):
+                    c_ex1, c_ex2, c_ex3 = st.columns([1, 3, 1])
+                    c_ex1.markdown(f"**{row['amount']:,.0f} د.ع**")
+                    c_ex2.markdown(f"{row['reason']}")
+                    # تنسيق التاريخ
+                    exp_date = row['date'].strftime('%Y-%m-%d') if pd.notnull(row['date']) else ""
+                    c_ex3.caption(f"{exp_date}")
+                    
+                    if c_ex3.button("🗑️", key=f"del_exp_{row['id']}"):
+                        try:
+                            with db.transaction() as cur:
+                                summary.expense_deleted(cur, row['id'])
+                                cur.execute("DELETE FROM public.expenses WHERE id = %s", (int(row['id']),))
+                            st.toast("🗑️ تم حذف المصروف")
+                            data.invalidate("expenses"); st.rerun()
+                        except Exception: pass
+        else:
+            st.info("لا توجد مصاريف مسجلة")
+    except:
+        st.info("لا توجد مصاريف بعد")
 
-    # === 7. التقارير الذكية ===
-    with tabs[6]:
-        st.header("📊 ذكاء الأعمال (BI)")
+# === 7. التقارير الذكية ===
+def reports_section():
+    st.header("📊 ذكاء الأعمال (BI)")
+    try:
+        # --- حسابات التواريخ (بتوقيت بغداد) ---
+        now = get_baghdad_time()
+        today_str = now.strftime("%Y-%m-%d")
+        month_prev_str = (now.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+
+        # كل الفترات من جدول daily_summary الملخص باستعلام واحد (data.period_totals، مخزن في الكاش)
         try:
-            # --- حسابات التواريخ ---
-            now = get_baghdad_time()
-            today_str = now.strftime("%Y-%m-%d")
-            
-            # 2. آخر 7 أيام (الأسبوع الحالي)
-            week_start = (now - timedelta(days=6)).strftime("%Y-%m-%d")
-            
-            # 3. الـ 7 أيام السابقة
-            prev_week_end = (now - timedelta(days=7)).strftime("%Y-%m-%d")
-            prev_week_start = (now - timedelta(days=13)).strftime("%Y-%m-%d")
-            
-            # 4. الشهر الحالي
-            month_curr_str = now.strftime("%Y-%m")
-            
-            # 5. الشهر السابق
-            first_day_curr = now.replace(day=1)
-            prev_month_date = first_day_curr - timedelta(days=1)
-            month_prev_str = prev_month_date.strftime("%Y-%m")
+            sales_by_period = data.sales_summary(now.date())
+        except Exception:
+            sales_by_period = {p: [0, 0, 0] for p in data.REPORT_PERIODS}
+        try:
+            exp_by_period = data.expense_summary(now.date())
+        except Exception:
+            exp_by_period = {p: 0 for p in data.REPORT_PERIODS}
 
-            # تم تحديث الاستعلامات للتعامل مع TIMESTAMP
-            def get_stats(where_clause, params=None):
-                try:
-                    query = f"""
-                        SELECT 
-                            COALESCE(SUM(total), 0), 
-                            COALESCE(SUM(profit), 0), 
-                            COUNT(DISTINCT invoice_id) 
-                        FROM public.sales 
-                        WHERE {where_clause}
-                    """
-                    return pd.read_sql(query, conn, params=params).iloc[0]
-                except:
-                    return [0, 0, 0]
-
-            def get_exp(where_clause):
-                try:
-                    q = f"SELECT COALESCE(SUM(amount), 0) FROM public.expenses WHERE {where_clause}"
-                    return pd.read_sql(q, conn).iloc[0,0]
-                except: return 0
+        stats_today = sales_by_period["today"]
+        stats_week = sales_by_period["week"]
+        stats_prev_week = sales_by_period["prev_week"]
+        stats_month = sales_by_period["month"]
+        stats_prev_month = sales_by_period["prev_month"]
 
-            # جلب البيانات (مبيعات) - باستخدام دوال التاريخ في SQL
-            # اليوم: نحول الـ timestamp إلى date للمقارنة
-            stats_today = get_stats(f"date::date = '{today_str}'")
-            
-            # الأسبوع: مقارنة مباشرة
-            stats_week = get_stats(f"date >= '{week_start}'")
-            stats_prev_week = get_stats(f"date >= '{prev_week_start}' AND date < '{week_start}'")
-            
-            # الشهر: استخدام to_char للتنسيق YYYY-MM
-            stats_month = get_stats(f"to_char(date, 'YYYY-MM') = '{month_curr_str}'")
-            stats_prev_month = get_stats(f"to_char(date, 'YYYY-MM') = '{month_prev_str}'")
-
-            # جلب البيانات (مصاريف)
-            exp_today = get_exp(f"date::date = '{today_str}'")
-            exp_week = get_exp(f"date >= '{week_start}'")
-            exp_prev_week = get_exp(f"date >= '{prev_week_start}' AND date < '{week_start}'")
-            exp_month = get_exp(f"to_char(date, 'YYYY-MM') = '{month_curr_str}'")
-            exp_prev_month = get_exp(f"to_char(date, 'YYYY-MM') = '{month_prev_str}'")
-
-            # --- New: Invoice Counts Logic ---
-            # Calculate start of current week (assuming Saturday start)
-            days_since_sat = (now.weekday() - 5) % 7
-            this_week_start_date = now - timedelta(days=days_since_sat)
-            this_week_start_str = this_week_start_date.strftime("%Y-%m-%d")
-            
-            # Previous week (Entire last week)
-            last_week_start_date = this_week_start_date - timedelta(days=7)
-            last_week_start_str = last_week_start_date.strftime("%Y-%m-%d")
-            
-            # Get stats for these specific periods
-            stats_strict_curr_week = get_stats(f"date >= '{this_week_start_str}'")
-            stats_strict_prev_week = get_stats(f"date >= '{last_week_start_str}' AND date < '{this_week_start_str}'")
-            
-            inv_curr_week = stats_strict_curr_week[2]
-            inv_prev_week = stats_strict_prev_week[2]
-            inv_curr_month = stats_month[2]
-            inv_prev_month = stats_prev_month[2]
-
-            # --- Display New Metrics (Invoice Counts) ---
-            st.subheader("🔢 عدد الفواتير (Transactions)")
-            c_inv1, c_inv2, c_inv3, c_inv4 = st.columns(4)
-            c_inv1.metric("الأسبوع الحالي", f"{inv_curr_week} فاتورة")
-            c_inv2.metric("الأسبوع السابق", f"{inv_prev_week} فاتورة")
-            c_inv3.metric("الشهر الحالي", f"{inv_curr_month} فاتورة")
-            c_inv4.metric("الشهر السابق", f"{inv_prev_month} فاتورة")
-            st.divider()
+        exp_today = exp_by_period["today"]
+        exp_week = exp_by_period["week"]
+        exp_prev_week = exp_by_period["prev_week"]
+        exp_month = exp_by_period["month"]
+        exp_prev_month = exp_by_period["prev_month"]
 
-            # عرض البيانات
-            st.subheader("📅 ملخص المبيعات")
-            
-            # صف اليوم
-            st.markdown(f"##### اليوم ({today_str})")
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("مبيعات", f"{stats_today[0]:,.0f}", f"{stats_today[2]} فاتورة")
-            c2.metric("أرباح (خام)", f"{stats_today[1]:,.0f}")
-            c3.metric("مصاريف", f"{exp_today:,.0f}", delta_color="inverse")
-            c4.metric("صافي الربح", f"{stats_today[1]-exp_today:,.0f}")
-            
-            st.divider()
-            
-            # صف الأسبوع
-            st.markdown("##### 📅 الأسبوع (آخر 7 أيام)")
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("مبيعات", f"{stats_week[0]:,.0f}", delta=f"{stats_week[0]-stats_prev_week[0]:,.0f}")
-            c2.metric("أرباح (خام)", f"{stats_week[1]:,.0f}", delta=f"{stats_week[1]-stats_prev_week[1]:,.0f}")
-            c3.metric("مصاريف", f"{exp_week:,.0f}", delta=f"{exp_week-exp_prev_week:,.0f}", delta_color="inverse")
-            c4.metric("صافي الربح", f"{(stats_week[1]-exp_week):,.0f}", delta=f"{(stats_week[1]-exp_week)-(stats_prev_week[1]-exp_prev_week):,.0f}")
-            
-            st.caption(f"**الأسبوع السابق:** مبيعات: {stats_prev_week[0]:,.0f} | أرباح: {stats_prev_week[1]:,.0f} | صافي: {stats_prev_week[1]-exp_prev_week:,.0f}")
-            
-            st.divider()
-            
-            # صف الشهر
-            st.markdown("##### 🗓️ الشهر الحالي")
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("مبيعات", f"{stats_month[0]:,.0f}", delta=f"{stats_month[0]-stats_prev_month[0]:,.0f}")
-            c2.metric("أرباح (خام)", f"{stats_month[1]:,.0f}", delta=f"{stats_month[1]-stats_prev_month[1]:,.0f}")
-            c3.metric("مصاريف", f"{exp_month:,.0f}", delta=f"{exp_month-exp_prev_month:,.0f}", delta_color="inverse")
-            c4.metric("صافي الربح", f"{(stats_month[1]-exp_month):,.0f}", delta=f"{(stats_month[1]-exp_month)-(stats_prev_month[1]-exp_prev_month):,.0f}")
-
-            st.caption(f"**الشهر السابق ({month_prev_str}):** مبيعات: {stats_prev_month[0]:,.0f} | صافي: {stats_prev_month[1]-exp_prev_month:,.0f}")
-            
-            st.markdown("---")
-            
-            st.subheader("📦 القيمة المالية للمخزون (رأس المال)")
-            df_stock_val = pd.read_sql("""
-                SELECT SUM(stock * cost) as total_cost, SUM(stock * price) as total_revenue FROM public.variants
-            """, conn).iloc[0]
-            
-            total_cost_stock = df_stock_val['total_cost'] or 0
-            total_rev_stock = df_stock_val['total_revenue'] or 0
-            potential_profit = total_rev_stock - total_cost_stock
-            
-            col_s1, col_s2, col_s3 = st.columns(3)
-            col_s1.metric("رأس المال المجمد (التكلفة)", f"{total_cost_stock:,.0f} د.ع")
-            col_s2.metric("المبيعات المتوقعة", f"{total_rev_stock:,.0f} د.ع")
-            col_s3.metric("الربح الكامن", f"{potential_profit:,.0f} د.ع", delta="مكسب مستقبلي")
-            st.markdown("---")
+        # عدد الفواتير حسب الأسبوع التقويمي (يبدأ السبت)
+        inv_curr_week = sales_by_period["cal_week"][2]
+        inv_prev_week = sales_by_period["prev_cal_week"][2]
+        inv_curr_month = stats_month[2]
+        inv_prev_month = stats_prev_month[2]
+
+        # --- Display New Metrics (Invoice Counts) ---
+        profiler.mark("المؤشرات")
+        st.subheader("🔢 عدد الفواتير (Transactions)")
+        c_inv1, c_inv2, c_inv3, c_inv4 = st.columns(4)
+        c_inv1.metric("الأسبوع الحالي", f"{inv_curr_week} فاتورة")
+        c_inv2.metric("الأسبوع السابق", f"{inv_prev_week} فاتورة")
+        c_inv3.metric("الشهر الحالي", f"{inv_curr_month} فاتورة")
+        c_inv4.metric("الشهر السابق", f"{inv_prev_month} فاتورة")
+        st.divider()
+
+        # عرض البيانات
+        st.subheader("📅 ملخص المبيعات")
+        
+        # صف اليوم
+        st.markdown(f"##### اليوم ({today_str})")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("مبيعات", f"{stats_today[0]:,.0f}", f"{stats_today[2]} فاتورة")
+        c2.metric("أرباح (خام)", f"{stats_today[1]:,.0f}")
+        c3.metric("مصاريف", f"{exp_today:,.0f}", delta_color="inverse")
+        c4.metric("صافي الربح", f"{stats_today[1]-exp_today:,.0f}")
+        
+        st.divider()
+        
+        # صف الأسبوع
+        st.markdown("##### 📅 الأسبوع (آخر 7 أيام)")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("مبيعات", f"{stats_week[0]:,.0f}", delta=f"{stats_week[0]-stats_prev_week[0]:,.0f}")
+        c2.metric("أرباح (خام)", f"{stats_week[1]:,.0f}", delta=f"{stats_week[1]-stats_prev_week[1]:,.0f}")
+        c3.metric("مصاريف", f"{exp_week:,.0f}", delta=f"{exp_week-exp_prev_week:,.0f}", delta_color="inverse")
+        c4.metric("صافي الربح", f"{(stats_week[1]-exp_week):,.0f}", delta=f"{(stats_week[1]-exp_week)-(stats_prev_week[1]-exp_prev_week):,.0f}")
+        
+        st.caption(f"**الأسبوع السابق:** مبيعات: {stats_prev_week[0]:,.0f} | أرباح: {stats_prev_week[1]:,.0f} | صافي: {stats_prev_week[1]-exp_prev_week:,.0f}")
+        
+        st.divider()
+        
+        # صف الشهر
+        st.markdown("##### 🗓️ الشهر الحالي")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("مبيعات", f"{stats_month[0]:,.0f}", delta=f"{stats_month[0]-stats_prev_month[0]:,.0f}")
+        c2.metric("أرباح (خام)", f"{stats_month[1]:,.0f}", delta=f"{stats_month[1]-stats_prev_month[1]:,.0f}")
+        c3.metric("مصاريف", f"{exp_month:,.0f}", delta=f"{exp_month-exp_prev_month:,.0f}", delta_color="inverse")
+        c4.metric("صافي الربح", f"{(stats_month[1]-exp_month):,.0f}", delta=f"{(stats_month[1]-exp_month)-(stats_prev_month[1]-exp_prev_month):,.0f}")
+
+        st.caption(f"**الشهر السابق ({month_prev_str}):** مبيعات: {stats_prev_month[0]:,.0f} | صافي: {stats_prev_month[1]-exp_prev_month:,.0f}")
+        
+        st.markdown("---")
+        
+        profiler.mark("قيمة المخزون")
+        st.subheader("📦 القيمة المالية للمخزون (رأس المال)")
+        df_stock_val = data.stock_value()
+        
+        total_cost_stock = df_stock_val['total_cost'] or 0
+        total_rev_stock = df_stock_val['total_revenue'] or 0
+        potential_profit = total_rev_stock - total_cost_stock
+        
+        col_s1, col_s2, col_s3 = st.columns(3)
+        col_s1.metric("رأس المال المجمد (التكلفة)", f"{total_cost_stock:,.0f} د.ع")
+        col_s2.metric("المبيعات المتوقعة", f"{total_rev_stock:,.0f} د.ع")
+        col_s3.metric("الربح الكامن", f"{potential_profit:,.0f} د.ع", delta="مكسب مستقبلي")
+        st.markdown("---")
+        
+        c_best1, c_best2 = st.columns(2)
+        with c_best1:
+            profiler.mark("أكثر القطع مبيعاً")
+            st.subheader("🏆 أكثر القطع مبيعاً")
+            df_top_items = data.top_items(10)
             
-            c_best1, c_best2 = st.columns(2)
-            with c_best1:
-                st.subheader("🏆 أكثر القطع مبيعاً")
-                df_top_items = pd.read_sql("""
-                    SELECT 
-                        SUM(profit) as total_profit,
-                        SUM(total) as total_sales,
-                        SUM(qty) as total_qty,
-                        product_name as name
-                    FROM public.sales 
-                    GROUP BY product_name 
-                    ORDER BY SUM(profit) DESC 
-                    LIMIT 10
-                """, conn)
+            if not df_top_items.empty:
+                df_top_items['avg_price'] = df_top_items['total_sales'] / df_top_items['total_qty']
                 
-                if not df_top_items.empty:
-                    df_top_items['avg_price'] = df_top_items['total_sales'] / df_top_items['total_qty']
-                    
-                    st.dataframe(
-                        df_top_items,
-                        column_config={
-                            "name": "المنتج",
-                            "total_qty": st.column_config.NumberColumn("العدد", help="عدد القطع المباعة"),
-                            "avg_price": st.column_config.NumberColumn("متوسط السعر", format="%d د.ع"),
-                            "total_sales": st.column_config.NumberColumn("المبيعات", format="%d د.ع"),
-                            "total_profit": st.column_config.ProgressColumn(
-                                "الربح", 
-                                help="مجموع الربح من هذا المنتج",
-                                format="%d د.ع",
-                                min_value=0,
-                                max_value=int(df_top_items['total_profit'].max()),
-                            ),
-                        },
-                        column_order=["total_profit", "total_sales", "avg_price", "total_qty", "name"],
-                        use_container_width=True, 
-                        hide_index=True
-                    )
-                else: st.info("لا توجد بيانات كافية")
-                    
-            with c_best2:
-                st.subheader("🌟 أفضل الزبائن")
-                df_top_cust = pd.read_sql("""
-                    SELECT 
-                        SUM(s.total) as total_spend,
-                        COUNT(s.id) as orders_count,
-                        c.name as name
-                    FROM public.sales s 
-                    JOIN public.customers c ON s.customer_id = c.id
-                    GROUP BY c.name 
-                    ORDER BY SUM(s.total) DESC 
-                    LIMIT 10
-                """, conn)
+                st.dataframe(
+                    df_top_items,
+                    column_config={
+                        "name": "المنتج",
+                        "total_qty": st.column_config.NumberColumn("العدد", help="عدد القطع المباعة"),
+                        "avg_price": st.column_config.NumberColumn("متوسط السعر", format="%d د.ع"),
+                        "total_sales": st.column_config.NumberColumn("المبيعات", format="%d د.ع"),
+                        "total_profit": st.column_config.ProgressColumn(
+                            "الربح", 
+                            help="مجموع الربح من هذا المنتج",
+                            format="%d د.ع",
+                            min_value=0,
+                            max_value=int(df_top_items['total_profit'].max()),
+                        ),
+                    },
+                    column_order=["total_profit", "total_sales", "avg_price", "total_qty", "name"],
+                    use_container_width=True, 
+                    hide_index=True
+                )
+            else: st.info("لا توجد بيانات كافية")
                 
-                if not df_top_cust.empty:
-                    for i, r in df_top_cust.iterrows():
-                        rank = i + 1
-                        badge = "🏅"
-                        if rank == 1: badge = "🥇"
-                        elif rank == 2: badge = "🥈"
-                        elif rank == 3: badge = "🥉"
-                        else: badge = f"#{rank}"
-                        
-                        st.markdown(f"""
-                        <div class="css-card" style="display: flex; justify-content: space-between; align-items: center; padding: 12px 16px;">
-                            <div style="display: flex; align-items: center; gap: 12px; flex: 1;">
-                                <div style="font-size: 1.5em; width: 40px; text-align: center;">{badge}</div>
-                                <div>
-                                    <div style="font-weight: 800; font-size: 1.1em; color: var(--text-color);">{r['name']}</div>
-                                    <div style="font-size: 0.8em; color: var(--subtext-color);">{r['orders_count']} طلبات</div>
-                                </div>
-                            </div>
-                            <div style="text-align: left;">
-                                <div style="font-weight: 800; color: var(--primary-color); font-size: 1.2em;">{r['total_spend']:,.0f}</div>
-                                <div style="font-size: 0.7em; color: var(--subtext-color);">د.ع</div>
+        with c_best2:
+            profiler.mark("بطاقات أفضل الزبائن")
+            st.subheader("🌟 أفضل الزبائن")
+            df_top_cust = data.top_customers(10)
+            
+            if not df_top_cust.empty:
+                for i, r in df_top_cust.iterrows():
+                    rank = i + 1
+                    badge = "🏅"
+                    if rank == 1: badge = "🥇"
+                    elif rank == 2: badge = "🥈"
+                    elif rank == 3: badge = "🥉"
+                    else: badge = f"#{rank}"
+                    
+                    st.markdown(f"""
+                    <div class="css-card" style="display: flex; justify-content: space-between; align-items: center; padding: 12px 16px;">
+                        <div style="display: flex; align-items: center; gap: 12px; flex: 1;">
+                            <div style="font-size: 1.5em; width: 40px; text-align: center;">{badge}</div>
+                            <div>
+                                <div style="font-weight: 800; font-size: 1.1em; color: var(--text-color);">{r['name']}</div>
+                                <div style="font-size: 0.8em; color: var(--subtext-color);">{r['orders_count']} طلبات</div>
                             </div>
                         </div>
-                        """, unsafe_allow_html=True) 
-                else: st.info("لا توجد بيانات كافية")
+                        <div style="text-align: left;">
+                            <div style="font-weight: 800; color: var(--primary-color); font-size: 1.2em;">{r['total_spend']:,.0f}</div>
+                            <div style="font-size: 0.7em; color: var(--subtext-color);">د.ع</div>
+                        </div>
+                    </div>
+                    """, unsafe_allow_html=True) 
+            else: st.info("لا توجد بيانات كافية")
 
-            st.markdown("---")
-            
-            c_col, c_siz = st.columns(2)
-            
-            with c_col:
-                st.subheader("🎨 أكثر الألوان رغبة")
-                try:
-                    df_colors = pd.read_sql("""
-                        SELECT v.color, SUM(s.qty) as qty 
-                        FROM public.sales s 
-                        JOIN public.variants v ON s.variant_id = v.id 
-                        GROUP BY v.color 
-                        ORDER BY qty DESC LIMIT 5
-                    """, conn)
-                    if not df_colors.empty:
-                        st.bar_chart(df_colors.set_index('color'))
-                    else: st.caption("لا توجد بيانات")
-                except: st.caption("جاري التحديث...")
-
-            with c_siz:
-                st.subheader("📏 أكثر القياسات طلباً")
-                try:
-                    df_sizes = pd.read_sql("""
-                        SELECT v.size, SUM(s.qty) as qty 
-                        FROM public.sales s 
-                        JOIN public.variants v ON s.variant_id = v.id 
-                        GROUP BY v.size 
-                        ORDER BY qty DESC LIMIT 5
-                    """, conn)
-                    if not df_sizes.empty:
-                        st.bar_chart(df_sizes.set_index('size'), color="#FF4B4B")
-                    else: st.caption("لا توجد بيانات")
-                except: st.caption("جاري التحديث...")
-        except Exception as e:
-            st.info("البيانات قيد التجميع...")
+        st.markdown("---")
+        
+        c_col, c_siz = st.columns(2)
+        
+        with c_col:
+            profiler.mark("الألوان والقياسات")
+            st.subheader("🎨 أكثر الألوان رغبة")
+            try:
+                df_colors = data.top_colors(5)
+                if not df_colors.empty:
+                    st.bar_chart(df_colors.set_index('color'))
+                else: st.caption("لا توجد بيانات")
+            except: st.caption("جاري التحديث...")
+
+        with c_siz:
+            st.subheader("📏 أكثر القياسات طلباً")
+            try:
+                df_sizes = data.top_sizes(5)
+                if not df_sizes.empty:
+                    st.bar_chart(df_sizes.set_index('size'), color="#FF4B4B")
+                else: st.caption("لا توجد بيانات")
+            except: st.caption("جاري التحديث...")
+    except Exception as e:
+        st.info("البيانات قيد التجميع...")
+
+    profiler.mark("التصدير")
+    export_panel()
+
+
+EXPORT_LABELS = {"sales": "المبيعات", "returns": "الرواجع", "expenses": "المصاريف", "inventory": "المخزون"}
+
+
+def export_panel():
+    """Full-history downloads; the file is built only when the button is clicked."""
+    with st.expander("📤 تصدير البيانات (CSV / Excel)"):
+        c1, c2, c3 = st.columns(3)
+        kind = c1.selectbox("البيانات", list(EXPORT_LABELS), format_func=EXPORT_LABELS.get, key="export_kind")
+        fmt = c2.radio("الصيغة", list(export.FORMATS), horizontal=True, key="export_format")
+        days = ()
+        if export.EXPORTS[kind]["date"]:
+            days = c3.date_input("الفترة (فارغة = كل السجل)", value=(), format="YYYY-MM-DD", key="export_days")
+            days = tuple(days) if isinstance(days, (tuple, list)) else (days,)
+        day_from, day_to = (days[0], days[-1]) if days else (None, None)
+        build, mime = export.FORMATS[fmt]
+        suffix = f"_{day_from}_{day_to}" if days else ""
+        st.download_button(
+            "⬇️ تحميل", data=lambda: build(kind, day_from, day_to),
+            file_name=f"{kind}{suffix}.{fmt}", mime=mime, use_container_width=True
+        )
+
+# --- 6. التطبيق الرئيسي ---
+# كل قسم يُنفَّذ فقط عند فتحه، بدل تشغيل الأقسام السبعة مع كل تفاعل
+SECTIONS = {
+    "🛍️ بيع": sale_section,
+    "📝 سجل": log_section,
+    "↩️ رواجع": returns_section,
+    "👥 عملاء": customers_section,
+    "📦 مخزن": inventory_section,
+    "💸 مصاريف": expenses_section,
+    "📊 تقارير": reports_section,
+}
+
+# --- لوحة المشرف: استعلامات SQL لكل إعادة تشغيل ---
+SQL_TRACE_HISTORY = 20
+
+
+def is_admin():
+    """The panel shows only with ``?admin=<token>`` matching ``[admin] token`` in secrets."""
+    token = st.secrets.get("admin", {}).get("token")
+    given = st.query_params.get("admin")
+    return bool(token) and given is not None and hmac.compare_digest(str(given), str(token))
+
+
+def sql_panel():
+    history = st.session_state.get('sql_traces', [])
+    config = sqltrace.settings()
+    with st.expander("🛠️ استعلامات SQL (مشرف)"):
+        st.caption(f"الاستعلامات الأبطأ من {config['slow_ms']} ms تُسجل في {config['log_path']}")
+        listener = livesync.get_listener()
+        if listener is not None:
+            st.caption(f"مزامنة الجلسات: {listener.status()}")
+        if not history:
+            st.info("لا توجد بيانات بعد"); return
+        df_runs = pd.DataFrame([t.summary() for t in reversed(history)])
+        st.dataframe(df_runs, hide_index=True, use_container_width=True)
+        by_section = df_runs.groupby("section")[["statements", "sql_ms"]].mean().round(1).sort_values("sql_ms", ascending=False)
+        st.markdown("##### المعدل لكل قسم")
+        st.dataframe(by_section, use_container_width=True)
+        last = history[-1]
+        st.markdown(f"##### آخر تشغيل: {last.label} ({len(last.statements)} استعلام، {last.total_ms:,.1f} ms)")
+        if last.statements:
+            st.dataframe(pd.DataFrame(last.statements), hide_index=True, use_container_width=True)
+
+
+def render_panel():
+    history = st.session_state.get('render_profiles', [])
+    with st.expander("⏱️ زمن العرض وعدد العناصر (مشرف)", expanded=True):
+        if not history:
+            st.info("لا توجد بيانات بعد"); return
+        df_seg = pd.DataFrame([row for p in history for row in p.rows()])
+        heaviest = (
+            df_seg.groupby(["section", "segment"], sort=False)[["ms", "elements", "blocks", "deltas", "kb"]]
+            .mean().round(1).sort_values("ms", ascending=False)
+        )
+        st.markdown("##### الأجزاء الأثقل (معدل آخر التشغيلات)")
+        st.dataframe(heaviest, use_container_width=True)
+        last = history[-1]
+        st.markdown(f"##### آخر تشغيل: {last.label}")
+        st.dataframe(pd.DataFrame(last.rows()), hide_index=True, use_container_width=True)
+
+
+def memory_panel():
+    with st.expander("🧮 ذاكرة الجداول المحملة (مشرف)"):
+        rows = data.frame_memory()
+        if not rows:
+            st.info("لا توجد بيانات بعد"); return
+        df_mem = pd.DataFrame(rows)
+        st.caption(f"المجموع: {df_mem['kb'].sum():,.1f} KB (بدون تحديد الأنواع {df_mem['untyped_kb'].sum():,.1f} KB)")
+        st.dataframe(df_mem, hide_index=True, use_container_width=True)
+
+
+def prefetch_panel(prefetcher):
+    with st.expander("🔥 التحميل المسبق للأقسام (مشرف)"):
+        st.dataframe(pd.DataFrame([prefetcher.stats()]), hide_index=True, use_container_width=True)
+        if prefetcher.last_ms:
+            df_last = pd.DataFrame(sorted(prefetcher.last_ms.items()), columns=["read", "ms"])
+            st.dataframe(df_last, hide_index=True, use_container_width=True)
+
+
+def warm_other_sections():
+    """Queues the first-screen reads of every section once the active one has rendered."""
+    try:
+        prefetcher = prefetch.get_prefetcher()
+        if prefetcher is not None:
+            prefetcher.schedule(prefetch.section_reads(get_baghdad_time().date()))
+        return prefetcher
+    except Exception:
+        # التحميل المسبق تحسين فقط ولا يجوز أن يعطل الشاشة
+        return None
+
+
+def main_app():
+    section = st.radio("القسم", list(SECTIONS), horizontal=True, label_visibility="collapsed", key="active_section")
+    admin = is_admin()
+    # ?profile=1 مع رابط المشرف يفعّل قياس زمن العرض
+    profiling = admin and st.query_params.get("profile") == "1"
+    sqltrace.start(section)
+    if profiling:
+        profiler.start(section)
+    try:
+        SECTIONS[section]()
+    finally:
+        # يُحفظ حتى لو أوقف القسم التشغيل بـ st.rerun أو st.stop
+        trace = sqltrace.finish()
+        history = st.session_state.setdefault('sql_traces', [])
+        history.append(trace)
+        del history[:-SQL_TRACE_HISTORY]
+        profile = profiler.finish()
+        if profile is not None:
+            profiles = st.session_state.setdefault('render_profiles', [])
+            profiles.append(profile)
+            del profiles[:-SQL_TRACE_HISTORY]
+    prefetcher = warm_other_sections()
+    if admin:
+        sql_panel()
+        memory_panel()
+        if prefetcher is not None:
+            prefetch_panel(prefetcher)
+    if profiling:
+        render_panel()
 
 if __name__ == "__main__":
     if st.session_state.logged_in:
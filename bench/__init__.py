@@ -0,0 +1,11 @@
+"""
+Benchmark tooling: ``bench.seed`` fills a scratch Postgres with synthetic
+boutique data, ``bench.run`` times every tab and the reads behind it.
+
+    python -m bench.seed --dsn postgresql://... --scale medium --reset
+    python -m bench.run --dsn postgresql://... --out before.json
+    python -m bench.run --compare before.json after.json
+
+Both commands only accept an explicit --dsn (or $DATABASE_URL), never the
+app's secrets, so they cannot be pointed at the shop database by accident.
+"""
@@ -0,0 +1,178 @@
+"""
+Times every tab of the app through Streamlit's ``AppTest`` and the reads
+each tab issues, and writes the result as JSON.
+
+For each section the harness clears ``st.cache_data`` and measures one cold
+rerun (every read goes to Postgres, each one timed separately), then
+``--repeat`` warm reruns served from the cache. ``--compare`` prints the
+difference between two result files.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import psycopg2
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import db
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+class QueryRecorder:
+    """Wraps ``db.read_sql`` to time every read, labelled by the ``data`` function that issued it."""
+
+    def __init__(self):
+        self.queries = []
+        self._original = None
+
+    def __enter__(self):
+        self._original = original = db.read_sql
+
+        def timed(query, params=None):
+            started = time.perf_counter()
+            df = original(query, params)
+            # timed <- data._read <- data.<function>
+            caller = sys._getframe(2).f_code.co_name
+            self.queries.append({"name": caller, "ms": _ms(started), "rows": len(df)})
+            return df
+
+        db.read_sql = timed
+        return self
+
+    def __exit__(self, *exc):
+        db.read_sql = self._original
+
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(APP), text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _row_counts(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            counts = {}
+            for table in ("variants", "customers", "sales", "returns", "expenses"):
+                cur.execute(f"SELECT count(*) FROM public.{table}")
+                counts[table] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def _new_app(dsn, timeout):
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    at.secrets["postgres"] = {"dsn": dsn}
+    # الكاش الدافئ من التحميل المسبق يفسد قياس التشغيل البارد
+    at.secrets["prefetch"] = {"enabled": False}
+    at.session_state["logged_in"] = True
+    return at
+
+
+def _run(at):
+    started = time.perf_counter()
+    at.run()
+    elapsed = _ms(started)
+    if at.exception:
+        raise RuntimeError(f"app raised: {at.exception[0].message}")
+    return elapsed
+
+
+def bench_sections(dsn, repeat=5, timeout=120, only=None):
+    at = _new_app(dsn, timeout)
+    _run(at)  # الاستيراد وتطبيق الترحيلات وإنشاء الـ pool خارج القياس
+    labels = at.radio(key="active_section").options
+    results = {}
+    for label in labels:
+        if only and not any(o in label for o in only):
+            continue
+        at.session_state["active_section"] = label
+        st.cache_data.clear()
+        with QueryRecorder() as recorder:
+            cold = _run(at)
+        warm = [_run(at) for _ in range(repeat)]
+        results[label] = {
+            "cold_ms": cold,
+            "warm_ms": warm,
+            "warm_median_ms": statistics.median(warm) if warm else None,
+            "elements": len(list(at.main)),
+            "queries": recorder.queries,
+            "query_ms": round(sum(q["ms"] for q in recorder.queries), 2),
+        }
+        print(f"{label:<14} cold {cold:>9.1f} ms  warm {results[label]['warm_median_ms'] or 0:>8.1f} ms  "
+              f"{len(recorder.queries)} reads", file=sys.stderr)
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{'section':<14} {'metric':<8} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10} {'change':>8}")
+    for label, after in new["sections"].items():
+        before = old["sections"].get(label)
+        if not before:
+            continue
+        for metric in ("cold_ms", "warm_median_ms", "query_ms"):
+            a, b = before.get(metric), after.get(metric)
+            if not a or b is None:
+                continue
+            print(f"{label:<14} {metric[:8]:<8} {a:>10.1f} {b:>10.1f} {(b - a) / a * 100:>+7.1f}%")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Time every app section against a seeded database")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Postgres connection string")
+    parser.add_argument("--repeat", type=int, default=5, help="warm reruns per section")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest timeout per rerun (seconds)")
+    parser.add_argument("--section", action="append", help="only sections whose label contains this text")
+    parser.add_argument("--out", help="write the JSON result here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    if not args.dsn:
+        sys.exit("--dsn or $DATABASE_URL is required")
+    result = {
+        "commit": _git_commit(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "repeat": args.repeat,
+        "rows": _row_counts(args.dsn),
+        "sections": bench_sections(args.dsn, args.repeat, args.timeout, args.section),
+    }
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
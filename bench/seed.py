@@ -0,0 +1,256 @@
+"""
+Seeded generator of realistic boutique data for benchmarks.
+
+The same ``--seed`` and scale always produce the same rows. Tables are
+filled with COPY in chunks, then the derived tables (``daily_summary``,
+``customer_stats``) are rebuilt and everything is ANALYZEd.
+
+Foreign keys use the ids Postgres actually assigned (read back after each
+COPY), and timestamps are stored the way the app stores them: Asia/Baghdad
+times converted to the session time zone.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+from datetime import date, datetime, time, timedelta
+
+import psycopg2
+import pytz
+
+import migrations
+import summary
+
+# variants / customers / sales لكل حجم
+SCALES = {
+    "small": {"variants": 300, "customers": 500, "sales": 1_000},
+    "medium": {"variants": 3_000, "customers": 20_000, "sales": 100_000},
+    "large": {"variants": 20_000, "customers": 60_000, "sales": 1_000_000},
+}
+
+KINDS = ["فستان", "بلوزة", "تنورة", "عباية", "بنطلون", "قميص", "جاكيت", "كارديكان", "بيجامة", "شال", "تيشيرت", "جمبسوت"]
+STYLES = ["سهرة", "كاجوال", "صيفي", "شتوي", "مطرز", "كلاسيك", "قطن", "ستان", "شيفون", "جينز", "تركي", "واسع"]
+COLORS = [
+    "أحمر", "أسود", "أبيض", "أزرق", "نيلي", "أخضر", "زيتوني", "أصفر", "بني", "برتقالي",
+    "بنفسجي", "وردي", "رمادي", "بيج", "نهدي", "ذهبي", "فضي", "خمري", "سمائي", "جوزي",
+]
+SIZE_SETS = [["S", "M", "L", "XL"], ["M", "L", "XL", "XXL"], ["38", "40", "42", "44"], ["فري سايز"]]
+FIRST_NAMES = [
+    "زهراء", "فاطمة", "مريم", "نور", "سارة", "رقية", "زينب", "هدى", "آية", "دعاء",
+    "رسل", "طيبة", "بنين", "حوراء", "تبارك", "ملاك", "شهد", "غدير", "يقين", "أديان",
+]
+LAST_NAMES = ["علي", "حسين", "محمد", "جاسم", "كاظم", "عباس", "الموسوي", "الحسيني", "الربيعي", "الجبوري"]
+CITIES = ["بغداد", "كربلاء", "النجف", "البصرة", "بابل", "الديوانية", "واسط", "ذي قار", "ميسان", "ديالى"]
+DELIVERY = ["24 ساعة", "48 ساعة", "3 ايام", "4 ايام"]
+EXPENSE_REASONS = ["توصيل", "تغليف", "إعلان انستغرام", "إيجار", "كهرباء", "رواتب"]
+
+TABLES = ["returns", "sales", "expenses", "customers", "variants", "daily_summary", "customer_stats"]
+
+BAGHDAD = pytz.timezone("Asia/Baghdad")
+
+
+def _copy(cur, table, columns, rows, chunk=50_000):
+    """COPYs ``rows`` (an iterable of tuples) into ``table`` in chunks."""
+    buf, count = io.StringIO(), 0
+
+    def flush():
+        buf.seek(0)
+        cur.copy_expert(f"COPY public.{table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+        buf.seek(0)
+        buf.truncate()
+
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["" if v is None else v for v in row])
+        count += 1
+        if count % chunk == 0:
+            flush()
+    if buf.tell():
+        flush()
+    return count
+
+
+def _ids(cur, table):
+    """Ids of ``table`` in insertion order; the table was empty before the COPY."""
+    cur.execute(f"SELECT id FROM public.{table} ORDER BY id")
+    return [row[0] for row in cur.fetchall()]
+
+
+def _session_zone(cur):
+    cur.execute("SHOW TimeZone")
+    return pytz.timezone(cur.fetchone()[0])
+
+
+def _stamp(when, zone):
+    """
+    Text for a TIMESTAMP column equal to what psycopg2 stores for the aware
+    ``when``: the same instant as wall time in the session zone.
+    """
+    return when.astimezone(zone).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _price(rng):
+    return rng.randrange(15_000, 85_001, 250)
+
+
+def gen_variants(rng, n):
+    rows, seen = [], set()
+    model = 0
+    while len(rows) < n:
+        model += 1
+        name = f"{rng.choice(KINDS)} {rng.choice(STYLES)} {model}"
+        price = _price(rng)
+        cost = round(price * rng.uniform(0.45, 0.7), -2)
+        for color in rng.sample(COLORS, rng.randint(1, 4)):
+            for size in rng.choice(SIZE_SETS):
+                if len(rows) >= n or (name, color, size) in seen:
+                    continue
+                seen.add((name, color, size))
+                stock = 0 if rng.random() < 0.2 else rng.randint(1, 20)
+                rows.append((name, color, size, cost, price, stock))
+    return rows
+
+
+def gen_customers(rng, n):
+    rows, phones = [], set()
+    for i in range(n):
+        phone = f"07{rng.choice('5789')}{rng.randrange(10**8):08d}"
+        while phone in phones:
+            phone = f"07{rng.choice('5789')}{rng.randrange(10**8):08d}"
+        phones.add(phone)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        username = f"{rng.choice(['noor', 'zahraa', 'mariam', 'sara', 'zainab', 'huda'])}_{i}"
+        rows.append((name, phone, f"{rng.choice(CITIES)} - حي {rng.randint(1, 60)}", username))
+    return rows
+
+
+def gen_sales(rng, n, variants, variant_ids, customer_ids, days, now, zone):
+    """
+    Yields sale lines grouped in invoices of 1-4 lines. Customers follow a
+    long tail (a few regulars, many occasional buyers). ``variant_ids`` are
+    the ids of ``variants`` in the same order.
+    """
+    start = now - timedelta(days=days)
+    span = days * 86_400
+    sale_id = 0
+    while sale_id < n:
+        when = start + timedelta(seconds=rng.randrange(span))
+        # 5% من الزبائن زبونات دائمات يأخذن 40% من الفواتير
+        regulars = max(1, len(customer_ids) // 20)
+        customer = customer_ids[rng.randrange(regulars) if rng.random() < 0.4 else rng.randrange(len(customer_ids))]
+        invoice = when.strftime("%Y%m%d%H%M")
+        delivery = rng.choice(DELIVERY)
+        for _ in range(min(rng.choice([1, 1, 1, 2, 2, 3, 4]), n - sale_id)):
+            sale_id += 1
+            v_index = rng.randrange(len(variants))
+            v_id = variant_ids[v_index]
+            name, _, _, cost, price, _ = variants[v_index]
+            qty = rng.choice([1, 1, 1, 1, 2, 3])
+            total = price * qty
+            yield (
+                sale_id, customer, v_id, name, qty, total, (price - cost) * qty,
+                _stamp(when, zone), invoice, delivery
+            )
+
+
+def seed(conn, scale, seed_value=1, days=365, end=None):
+    """
+    Inserts one scale's worth of rows with history ending on the date
+    ``end`` (default today, so report periods are populated). Returns the
+    row count per table.
+    """
+    rng = random.Random(seed_value)
+    # بغداد بلا توقيت صيفي، فالجمع والطرح على الوقت المحلي آمن
+    now = BAGHDAD.localize(datetime.combine(end or date.today(), time(12, 0)))
+    counts = {}
+    with conn.cursor() as cur:
+        zone = _session_zone(cur)
+        variants = gen_variants(rng, scale["variants"])
+        counts["variants"] = _copy(cur, "variants", ["name", "color", "size", "cost", "price", "stock"], variants)
+        variant_ids = _ids(cur, "variants")
+        counts["customers"] = _copy(
+            cur, "customers", ["name", "phone", "address", "username"], gen_customers(rng, scale["customers"])
+        )
+        customer_ids = _ids(cur, "customers")
+        v_index = {v_id: i for i, v_id in enumerate(variant_ids)}
+
+        returns = []
+
+        def sales():
+            for row in gen_sales(rng, scale["sales"], variants, variant_ids, customer_ids, days, now, zone):
+                if rng.random() < 0.03:
+                    sale_id, customer, v_id, name, qty, total, _, when, _, _ = row
+                    _, color, size, _, _, _ = variants[v_index[v_id]]
+                    status = "Pending" if rng.random() < 0.3 else "Received"
+                    returns.append((sale_id, v_id, customer, name, f"{color} - {size}", qty, total, when, status))
+                yield row
+
+        counts["sales"] = _copy(cur, "sales", [
+            "id", "customer_id", "variant_id", "product_name", "qty", "total", "profit", "date", "invoice_id", "delivery_duration"
+        ], sales())
+        cur.execute("SELECT setval(pg_get_serial_sequence('public.sales', 'id'), GREATEST(MAX(id), 1)) FROM public.sales")
+        counts["returns"] = _copy(cur, "returns", [
+            "sale_id", "variant_id", "customer_id", "product_name", "product_details", "qty", "return_amount", "return_date", "status"
+        ], returns)
+
+        def expenses():
+            for day in range(days):
+                for _ in range(rng.randint(0, 3)):
+                    when = now - timedelta(days=day, seconds=rng.randrange(86_400))
+                    yield rng.randrange(5_000, 250_001, 1_000), rng.choice(EXPENSE_REASONS), _stamp(when, zone)
+
+        counts["expenses"] = _copy(cur, "expenses", ["amount", "reason", "date"], expenses())
+        counts["daily_summary"] = summary.rebuild(cur)
+        counts["customer_stats"] = summary.rebuild_customer_stats(cur)
+        cur.execute("ANALYZE")
+    conn.commit()
+    return counts
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fill a scratch database with synthetic boutique data")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="Postgres connection string (required)")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--variants", type=int, help="override the scale's variant count")
+    parser.add_argument("--customers", type=int, help="override the scale's customer count")
+    parser.add_argument("--sales", type=int, help="override the scale's sale line count")
+    parser.add_argument("--days", type=int, default=365, help="history length in days")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day of history (YYYY-MM-DD, default today)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reset", action="store_true", help="truncate the app tables first")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.dsn:
+        sys.exit("--dsn or $DATABASE_URL is required")
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        migrations.migrate(conn)
+        with conn.cursor() as cur:
+            if args.reset:
+                cur.execute(f"TRUNCATE {', '.join('public.' + t for t in TABLES)} RESTART IDENTITY")
+            else:
+                # ids تُقرأ بعد COPY بترتيب الإدخال، فيجب أن تبدأ كل الجداول فارغة
+                cur.execute("SELECT " + " OR ".join(f"EXISTS (SELECT 1 FROM public.{t})" for t in TABLES))
+                if cur.fetchone()[0]:
+                    sys.exit("database is not empty; pass --reset to truncate it")
+        conn.commit()
+        counts = seed(conn, scale, args.seed, args.days, args.end)
+    finally:
+        conn.close()
+    for table, count in counts.items():
+        print(f"{table:>15}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Bulk catalog import from a supplier sheet (CSV or XLSX).
+
+1. ``read_sheet`` maps the header row to name/color/size/stock/cost/price
+   (Arabic or English headers, including the inventory export's own).
+2. ``prepare`` cleans every cell, expands multi-value color/size cells with
+   ``parse_multi_input`` and folds names and colors into existing spellings
+   with the same ``Matcher`` rules as the "add variant" form. Values new to
+   the catalog are matched against each other too, so one sheet cannot add
+   both "بلوزه" and "بلوزة".
+3. ``stage`` COPYs the prepared rows into a temporary table and ``preview``
+   joins it to ``public.variants`` to show what will be added or updated.
+4. ``merge`` applies the staged rows in one ``INSERT ... ON CONFLICT`` with
+   the restock semantics of ``inventory.upsert_variants``: stock is added,
+   price and cost are replaced.
+"""
+import csv
+import io
+import itertools
+
+import pandas as pd
+
+from matching import clean_text, normalize, parse_multi_input
+
+# رؤوس الأعمدة المقبولة لكل حقل (تُقارن بعد normalize)
+HEADERS = {
+    "name": ("name", "product", "المنتج", "اسم المنتج", "الاسم"),
+    "color": ("color", "colour", "اللون", "الألوان"),
+    "size": ("size", "القياس", "القياسات"),
+    "stock": ("stock", "qty", "quantity", "العدد", "الكمية"),
+    "cost": ("cost", "التكلفة", "سعر التكلفة"),
+    "price": ("price", "سعر البيع", "السعر"),
+}
+REQUIRED = ("name", "color", "size", "cost", "price")
+_HEADER_KEYS = {normalize(alias): field for field, aliases in HEADERS.items() for alias in aliases}
+
+# الأسطر المكررة لنفس الصنف تُجمع: العدد يُجمع والسعر من آخر سطر في الملف
+STAGED_VARIANTS = """
+    SELECT name, color, size, SUM(stock)::int AS stock,
+           (array_agg(price ORDER BY line DESC))[1] AS price,
+           (array_agg(cost ORDER BY line DESC))[1] AS cost
+    FROM catalog_staging
+    GROUP BY name, color, size
+"""
+
+
+def _rows_from_csv(data):
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    return csv.reader(io.StringIO(text))
+
+
+def _rows_from_xlsx(data):
+    # openpyxl يُستورد عند الطلب فقط، كما في export.to_xlsx
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    return workbook.active.iter_rows(values_only=True)
+
+
+def read_sheet(data, filename):
+    """
+    Returns ``[(line, {field: cell})]`` for every non-empty data row of a CSV
+    or XLSX file. Raises ``ValueError`` if a required column is missing.
+    """
+    rows = _rows_from_xlsx(data) if filename.lower().endswith((".xlsx", ".xlsm")) else _rows_from_csv(data)
+    header = next(iter(rows), None) or []
+    columns = {}
+    for pos, title in enumerate(header):
+        field = _HEADER_KEYS.get(normalize(str(title or "")))
+        if field and field not in columns:
+            columns[field] = pos
+    missing = [f for f in REQUIRED if f not in columns]
+    if missing:
+        raise ValueError(f"أعمدة ناقصة في الملف: {', '.join(HEADERS[f][-1] for f in missing)}")
+    out = []
+    for line, row in enumerate(rows, start=2):
+        cells = {f: (row[pos] if pos < len(row) else None) for f, pos in columns.items()}
+        if any(v not in (None, "") for v in cells.values()):
+            out.append((line, cells))
+    return out
+
+
+def _number(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(clean_text(str(value)).replace(",", "").replace("٬", ""))
+
+
+def prepare(sheet_rows, names, colors, threshold=0.85):
+    """
+    Cleans, expands and fuzzy-matches the rows from ``read_sheet`` against
+    the ``names`` and ``colors`` matchers (``data.catalog_matchers``).
+
+    Returns ``(rows, renames, problems)``: ``rows`` are
+    ``(line, name, color, size, stock, price, cost)``, ``renames`` maps
+    ``(field, sheet value)`` to the spelling used, ``problems`` lists
+    ``(line, message)`` for rows that were skipped.
+    """
+    rows, renames, problems = [], {}, []
+    resolved = {}
+
+    def resolve(field, matcher, value):
+        key = (field, value)
+        if key not in resolved:
+            final = matcher.match(value, threshold)
+            # قيمة جديدة تصبح مرجعاً لباقي أسطر الملف
+            matcher.add(final)
+            resolved[key] = final
+            if final != value:
+                renames[key] = final
+        return resolved[key]
+
+    for line, cells in sheet_rows:
+        name = clean_text(str(cells.get("name") or ""))
+        color_list = parse_multi_input(str(cells.get("color") or ""))
+        size_list = parse_multi_input(str(cells.get("size") or ""))
+        if not name or not color_list or not size_list:
+            problems.append((line, "الاسم واللون والقياس مطلوبة"))
+            continue
+        try:
+            stock, price, cost = (_number(cells.get(f)) for f in ("stock", "price", "cost"))
+        except ValueError:
+            problems.append((line, "العدد أو السعر ليس رقماً"))
+            continue
+        if stock < 0 or price < 0 or cost < 0 or stock != int(stock):
+            problems.append((line, "العدد والأسعار يجب أن تكون موجبة والعدد صحيحاً"))
+            continue
+        final_name = resolve("name", names, name)
+        for color, size in itertools.product(color_list, size_list):
+            rows.append((line, final_name, resolve("color", colors, color), size, int(stock), price, cost))
+    return rows, renames, problems
+
+
+def stage(cur, rows):
+    """COPYs the prepared rows into ``catalog_staging``, dropped when the transaction ends."""
+    cur.execute("""
+        CREATE TEMP TABLE catalog_staging (
+            line INTEGER, name TEXT, color TEXT, size TEXT, stock INTEGER, price REAL, cost REAL
+        ) ON COMMIT DROP
+    """)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY catalog_staging (line, name, color, size, stock, price, cost) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def preview(cur):
+    """The staged variants next to their current values; ``new`` is true for keys not in the catalog."""
+    cur.execute(f"""
+        SELECT s.name, s.color, s.size, v.id IS NULL AS new,
+               s.stock AS add_stock, v.stock AS old_stock,
+               s.price, v.price AS old_price, s.cost, v.cost AS old_cost
+        FROM ({STAGED_VARIANTS}) s
+        LEFT JOIN public.variants v ON v.name = s.name AND v.color = s.color AND v.size = s.size
+        ORDER BY s.name, s.color, s.size
+    """)
+    return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+
+def merge(cur):
+    """Applies the staged variants in one statement. Returns ``(added, updated)``."""
+    cur.execute(f"""
+        INSERT INTO public.variants AS v (name, color, size, stock, price, cost)
+        {STAGED_VARIANTS}
+        ON CONFLICT (name, color, size) DO UPDATE SET
+            stock = COALESCE(v.stock, 0) + EXCLUDED.stock,
+            price = EXCLUDED.price,
+            cost = EXCLUDED.cost
+        RETURNING (xmax = 0)
+    """)
+    result = cur.fetchall()
+    added = sum(1 for (inserted,) in result if inserted)
+    return added, len(result) - added
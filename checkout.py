@@ -0,0 +1,109 @@
+"""
+Batched checkout.
+
+A whole cart is written with one guarded stock decrement and one multi-row
+insert of sale lines, inside the caller's transaction, so the number of
+round trips does not grow with the cart and stock can never go negative
+when two sessions sell the last piece at the same time.
+"""
+from psycopg2.extras import execute_values
+
+import summary
+
+
+class OutOfStock(Exception):
+    """
+    Raised when at least one cart line asks for more than is in stock.
+    ``short`` lists the offending lines with the quantity still available.
+    """
+
+    def __init__(self, short):
+        self.short = short
+        super().__init__(", ".join(f"{s['name']} ({s['available']}/{s['requested']})" for s in short))
+
+
+def reserve_stock(cur, cart):
+    """
+    Decrements stock for every cart line in one statement. Rows are locked in
+    id order (no deadlocks between overlapping carts) and a row is only
+    updated while ``stock >= qty``; if any line is short nothing is kept and
+    ``OutOfStock`` is raised.
+    """
+    requested = {}
+    for x in cart:
+        requested[int(x['id'])] = requested.get(int(x['id']), 0) + int(x['qty'])
+    ids = sorted(requested)
+    cur.execute("""
+        WITH req AS (
+            SELECT * FROM unnest(%s::int[], %s::int[]) AS r(id, qty)
+        ), locked AS (
+            SELECT v.id FROM public.variants v JOIN req ON req.id = v.id
+            ORDER BY v.id FOR UPDATE OF v
+        )
+        UPDATE public.variants v SET stock = v.stock - req.qty
+        FROM req JOIN locked ON locked.id = req.id
+        WHERE v.id = req.id AND v.stock >= req.qty
+        RETURNING v.id
+    """, (ids, [requested[i] for i in ids]))
+    updated = {row[0] for row in cur.fetchall()}
+    missing = [i for i in ids if i not in updated]
+    if missing:
+        cur.execute("SELECT id, stock FROM public.variants WHERE id = ANY(%s)", (missing,))
+        available = dict(cur.fetchall())
+        names = {int(x['id']): x for x in cart}
+        raise OutOfStock([
+            {
+                "id": i, "name": names[i]['name'], "color": names[i]['color'], "size": names[i]['size'],
+                "requested": requested[i], "available": int(available.get(i) or 0),
+            }
+            for i in missing
+        ])
+
+
+def find_or_create_customer(cur, name, phone, address, username):
+    """
+    Returns the id of the customer with ``phone``, refreshing a changed
+    address, or inserts a new one. Concurrent checkouts for the same phone
+    are serialized so they cannot both insert.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (phone,))
+    cur.execute("SELECT id FROM public.customers WHERE phone = %s ORDER BY id LIMIT 1", (phone,))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(
+            "INSERT INTO public.customers (name, phone, address, username) VALUES (%s,%s,%s,%s) RETURNING id",
+            (name, phone, address, username)
+        )
+        return cur.fetchone()[0]
+    if address:
+        cur.execute(
+            "UPDATE public.customers SET address = %s WHERE id = %s AND address IS DISTINCT FROM %s",
+            (address, row[0], address)
+        )
+    return row[0]
+
+
+def place_order(cur, customer_id, cart, when, invoice_id, delivery_duration):
+    """
+    Writes one order: guarded stock decrement, daily summary and customer
+    stats update and a single multi-row insert of the sale lines. Runs in the caller's
+    transaction; an ``OutOfStock`` leaves it for the caller to roll back.
+    """
+    reserve_stock(cur, cart)
+    summary.sale_added(
+        cur, when, invoice_id,
+        revenue=sum(x['total'] for x in cart),
+        profit=sum((x['price'] - x['cost']) * x['qty'] for x in cart),
+        units=sum(x['qty'] for x in cart),
+        customer_id=customer_id
+    )
+    execute_values(cur, """
+        INSERT INTO public.sales (customer_id, variant_id, product_name, qty, total, profit, date, invoice_id, delivery_duration)
+        VALUES %s
+    """, [
+        (
+            int(customer_id), int(x['id']), x['name'], int(x['qty']), float(x['total']),
+            float((x['price'] - x['cost']) * x['qty']), when, invoice_id, delivery_duration
+        )
+        for x in cart
+    ], page_size=len(cart) or 1)
@@ -0,0 +1,457 @@
+"""
+Cached read layer over the Supabase tables.
+
+Every query the UI renders from lives here behind ``st.cache_data`` with a TTL
+and is registered against the tables it reads. Write paths call
+``invalidate(...)`` with the tables they touched, so only the affected reads
+go back to the database on the next rerun.
+
+Frames are read with only the columns their view uses and cast to compact
+dtypes (see ``_typed``); ``frame_memory`` reports what each one costs.
+"""
+import time
+from datetime import timedelta
+from itertools import groupby
+
+import streamlit as st
+
+import db
+from matching import Matcher
+from migrations import CUSTOMER_SEARCH_TEXT, VARIANT_SEARCH_TEXT
+
+# مدة صلاحية الكاش بالثواني (الإبطال الفعلي يتم عند كل عملية كتابة)
+TTL_LIVE = 60       # المخزون، السجل، الرواجع، المصاريف
+TTL_REPORT = 300    # التقارير والتجميعات
+
+# table name -> cached functions that read it
+_dependents = {}
+
+
+def cached(*tables, ttl=TTL_LIVE, max_entries=None):
+    """
+    Wraps a read in ``st.cache_data`` and registers it under each table name
+    so that ``invalidate`` can clear it selectively.
+    """
+    def decorator(func):
+        wrapped = st.cache_data(ttl=ttl, max_entries=max_entries, show_spinner=False)(func)
+        for table in tables:
+            _dependents.setdefault(table, []).append(wrapped)
+        return wrapped
+    return decorator
+
+
+# callbacks notified with the cleared functions (the prefetcher cancels their tasks)
+_invalidate_listeners = []
+
+
+def on_invalidate(callback):
+    _invalidate_listeners.append(callback)
+
+
+def invalidate(*tables):
+    """Clears every cached read that depends on any of the given tables."""
+    cleared = {}
+    for table in tables:
+        for func in _dependents.get(table, []):
+            if id(func) in cleared:
+                continue
+            func.clear()
+            cleared[id(func)] = func
+    for callback in _invalidate_listeners:
+        callback(list(cleared.values()))
+
+
+# --- أنواع الأعمدة ---
+# النصوص المتكررة (اسم/لون/قياس) كـ category، المعرفات والكميات int32،
+# والمبالغ float32 لأنها أعمدة REAL في القاعدة (نفس الدقة أصلاً)
+VARIANT_DTYPES = {
+    "id": "int32", "name": "category", "color": "category", "size": "category",
+    "stock": "int32", "price": "float32", "cost": "float32",
+}
+# نافذة تعديل الكميات تحرر اللون والقياس كنص حر، فيبقيان نصاً
+EDITOR_DTYPES = {"id": "int32", "stock": "int32", "price": "float32", "cost": "float32"}
+SALE_DTYPES = {
+    "id": "int32", "customer_id": "int32", "variant_id": "int32", "product_name": "category",
+    "qty": "int32", "total": "float32", "color": "category", "size": "category",
+}
+RETURN_DTYPES = {
+    "id": "int32", "sale_id": "int32", "variant_id": "int32", "product_name": "category",
+    "qty": "int32", "return_amount": "float32",
+}
+EXPENSE_DTYPES = {"id": "int32", "amount": "float32"}
+CUSTOMER_DTYPES = {"id": "int32", "orders": "int32"}
+
+# read name -> rows and bytes of the last frame it loaded, before and after the casts
+_frame_memory = {}
+
+
+def _typed(df, dtypes):
+    """Casts the listed columns; an ``int32`` column holding NULLs becomes the nullable ``Int32``."""
+    cast = {}
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == "int32" and df[col].isna().any():
+            dtype = "Int32"
+        cast[col] = dtype
+    return df.astype(cast)
+
+
+def _read(query, params=None, dtypes=None, name=None):
+    """
+    ``db.read_sql`` plus the ``dtypes`` casts; a typed read passes its
+    ``name`` so ``frame_memory`` can report it.
+    """
+    df = db.read_sql(query, params)
+    if dtypes:
+        loaded = int(df.memory_usage(deep=True).sum())
+        df = _typed(df, dtypes)
+        # تُحسب فقط عند تحميل الإطار من القاعدة (أي عند فشل الكاش)
+        _frame_memory[name or "(unnamed)"] = {
+            "rows": len(df), "kb": round(int(df.memory_usage(deep=True).sum()) / 1024, 1),
+            "untyped_kb": round(loaded / 1024, 1),
+        }
+    return df
+
+
+def frame_memory():
+    """Rows and memory of the last frame each typed read loaded, largest first."""
+    return sorted(
+        ({"read": name, **usage} for name, usage in _frame_memory.items()),
+        key=lambda r: r["kb"], reverse=True
+    )
+
+
+# --- المخزون ---
+@cached("variants")
+def inventory_totals():
+    """Header figures of the inventory tab in one aggregate, without loading the variant rows."""
+    row = _read("""
+        SELECT COUNT(*) AS variants,
+               COALESCE(SUM(stock), 0) AS pieces,
+               COALESCE(SUM(stock * cost::float8), 0) AS cost_value,
+               COALESCE(SUM(stock * price::float8), 0) AS sell_value,
+               COUNT(*) FILTER (WHERE stock < 5) AS low_stock
+        FROM public.variants
+    """).iloc[0]
+    return {k: float(v) if "value" in k else int(v) for k, v in row.items()}
+
+
+def _like_escape(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@cached("variants", max_entries=500)
+def search_variants(term, limit=50):
+    """
+    In-stock variants whose name/color/size contain every word of ``term``,
+    at most ``limit`` rows, name-prefix matches first. Each word is one
+    ``ILIKE`` over the trigram-indexed search text. ``read_at`` is the
+    ``time.time()`` just before the query, so a cached frame still tells
+    how old its stock is.
+    """
+    words = term.split()
+    params = {"limit": int(limit)}
+    where, order = ["stock > 0"], "name, color, size"
+    for i, word in enumerate(words):
+        params[f"w{i}"] = "%" + _like_escape(word) + "%"
+        where.append(f"{VARIANT_SEARCH_TEXT} ILIKE %(w{i})s")
+    if words:
+        params["prefix"] = _like_escape(words[0].lower()) + "%"
+        order = "(lower(name) LIKE %(prefix)s) DESC, " + order
+    # وقت القراءة يرافق المخزون إلى السلة (journal.reserved يحتاجه)
+    read_at = time.time()
+    df = _read(f"""
+        SELECT id, name, color, size, price, stock, cost FROM public.variants
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
+        LIMIT %(limit)s
+    """, params=params, dtypes=VARIANT_DTYPES, name="search_variants")
+    df["read_at"] = read_at
+    return df
+
+
+@cached("variants")
+def load_product_variants(product_name):
+    # كل القياسات حتى المنتهية (stock=0) للسماح بإعادة التعبئة
+    return _read(
+        "SELECT id, color, size, stock, price, cost FROM public.variants WHERE name = %s ORDER BY color, size",
+        params=(product_name,), dtypes=EDITOR_DTYPES, name="load_product_variants"
+    )
+
+
+@cached("variants", max_entries=100)
+def inventory_tree(term=""):
+    """
+    In-stock catalog grouped in one pass as
+    ``[{"name", "total", "colors": [{"color", "total", "sizes": [(size, qty)]}]}]``,
+    optionally narrowed to variants matching every word of ``term``.
+    """
+    where, params = ["stock > 0"], {}
+    for i, word in enumerate(term.split()):
+        params[f"w{i}"] = "%" + _like_escape(word) + "%"
+        where.append(f"{VARIANT_SEARCH_TEXT} ILIKE %(w{i})s")
+    df = _read(f"""
+        SELECT name, color, size, stock FROM public.variants
+        WHERE {" AND ".join(where)}
+        ORDER BY name, color, size
+    """, params=params or None, dtypes=VARIANT_DTYPES, name="inventory_tree")
+    tree = []
+    for name, rows in groupby(df.itertuples(index=False), key=lambda r: r.name):
+        colors = []
+        for color, c_rows in groupby(rows, key=lambda r: r.color):
+            sizes = sorted((str(r.size), int(r.stock)) for r in c_rows)
+            colors.append({"color": color, "total": sum(q for _, q in sizes), "sizes": sizes})
+        tree.append({"name": name, "total": sum(c["total"] for c in colors), "colors": colors})
+    return tree
+
+
+@cached("variants")
+def catalog_matchers():
+    """Fuzzy matchers over the existing product names and colors."""
+    df = _read("SELECT DISTINCT name, color FROM public.variants")
+    return Matcher(df['name'].dropna().unique()), Matcher(df['color'].dropna().unique())
+
+
+# --- العملاء ---
+@cached("customers", max_entries=500)
+def search_customers(term, limit=20):
+    """
+    Customers whose name, phone or username contain every word of ``term``,
+    newest first, at most ``limit`` rows (the checkout typeahead).
+    """
+    where, params = [], {"limit": int(limit)}
+    for i, word in enumerate(term.split()):
+        params[f"w{i}"] = "%" + _like_escape(word) + "%"
+        where.append(f"{CUSTOMER_SEARCH_TEXT} ILIKE %(w{i})s")
+    return _read(f"""
+        SELECT id, name, phone, username, address FROM public.customers
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY id DESC LIMIT %(limit)s
+    """, params=params, dtypes=CUSTOMER_DTYPES, name="search_customers")
+
+
+@cached("customers", max_entries=200)
+def customer_by_phone(phone):
+    df = _read(
+        "SELECT id, name, phone, username, address FROM public.customers WHERE phone = %s ORDER BY id LIMIT 1",
+        params=(phone,)
+    )
+    return None if df.empty else df.iloc[0].to_dict()
+
+
+@cached("customers", "sales", max_entries=200)
+def load_customer_page(term="", after=None, limit=20):
+    """
+    One page of the customer directory ordered by lifetime spend, read from
+    ``customer_stats``. ``after`` is the ``(total_spend, id)`` of the last
+    customer on the previous page; every word of ``term`` must appear in the
+    name, phone or username.
+
+    Returns ``(page, has_more)``.
+    """
+    where, params = [], {"limit": int(limit) + 1}
+    if after is not None:
+        where.append("(st.total_spend, st.customer_id) < (%(spend)s, %(id)s)")
+        params["spend"], params["id"] = float(after[0]), int(after[1])
+    for i, word in enumerate(term.split()):
+        params[f"w{i}"] = "%" + _like_escape(word) + "%"
+        where.append(f"{CUSTOMER_SEARCH_TEXT} ILIKE %(w{i})s")
+    df = _read(f"""
+        SELECT c.id, c.name, c.phone, c.username, c.address,
+               st.total_spend, st.orders, st.last_purchase
+        FROM public.customer_stats st
+        JOIN public.customers c ON c.id = st.customer_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY st.total_spend DESC, st.customer_id DESC
+        LIMIT %(limit)s
+    """, params=params, dtypes=CUSTOMER_DTYPES, name="load_customer_page")
+    return df.head(limit), len(df) > limit
+
+
+# --- السجل والرواجع والمصاريف ---
+# أعمدة صفحة السجل مع الربط بالزبون والصنف (كلاهما على المفتاح الأساسي)
+SALES_LOG_QUERY = """
+    SELECT s.id, s.customer_id, s.variant_id, s.product_name, s.qty, s.total, s.date,
+           c.name as customer_name, v.color, v.size
+    FROM public.sales s
+    LEFT JOIN public.customers c ON s.customer_id = c.id
+    LEFT JOIN public.variants v ON s.variant_id = v.id
+"""
+
+
+@cached("sales", "customers", "variants", max_entries=200)
+def load_sales_page(before_id=None, day_from=None, day_to=None, customer_id=None, product=None, limit=30):
+    """
+    One page of the sales log, newest first, with keyset pagination: pass
+    the smallest id of the previous page as ``before_id``. ``day_from`` and
+    ``day_to`` are inclusive Asia/Baghdad dates.
+
+    Returns ``(page, has_more)``.
+    """
+    where, params = [], {"limit": int(limit) + 1}
+    if before_id is not None:
+        where.append("s.id < %(before_id)s")
+        params["before_id"] = int(before_id)
+    if day_from is not None:
+        # حدود اليوم بتوقيت بغداد مقارنة مع TIMESTAMP المخزن بتوقيت الجلسة
+        where.append("s.date >= (%(day_from)s::timestamp AT TIME ZONE 'Asia/Baghdad')")
+        params["day_from"] = day_from
+    if day_to is not None:
+        where.append("s.date < ((%(day_to)s::date + 1)::timestamp AT TIME ZONE 'Asia/Baghdad')")
+        params["day_to"] = day_to
+    if customer_id is not None:
+        where.append("s.customer_id = %(customer_id)s")
+        params["customer_id"] = int(customer_id)
+    if product:
+        where.append("s.product_name = %(product)s")
+        params["product"] = product
+    df = _read(
+        SALES_LOG_QUERY
+        + (f"WHERE {' AND '.join(where)}" if where else "")
+        + " ORDER BY s.id DESC LIMIT %(limit)s",
+        params=params, dtypes=SALE_DTYPES, name="load_sales_page"
+    )
+    return df.head(limit), len(df) > limit
+
+
+@cached("variants")
+def load_product_names():
+    return _read("SELECT DISTINCT name FROM public.variants WHERE name IS NOT NULL ORDER BY name")['name'].tolist()
+
+
+@cached("returns")
+def load_pending_returns():
+    return _read("""
+        SELECT id, sale_id, variant_id, product_name, product_details, qty, return_amount
+        FROM public.returns WHERE status = 'Pending' ORDER BY id DESC
+    """, dtypes=RETURN_DTYPES, name="load_pending_returns")
+
+
+@cached("expenses")
+def load_recent_expenses(limit=50):
+    return _read(
+        "SELECT id, amount, reason, date FROM public.expenses ORDER BY id DESC LIMIT %s",
+        params=(limit,), dtypes=EXPENSE_DTYPES, name="load_recent_expenses"
+    )
+
+
+# --- التقارير ---
+# الفترات بالترتيب الذي تُعرض به في التقارير
+REPORT_PERIODS = ["today", "week", "prev_week", "cal_week", "prev_cal_week", "month", "prev_month"]
+
+
+def report_periods(today):
+    """
+    Half-open ``[start, end)`` day ranges for every report period, given the
+    Asia/Baghdad calendar date ``today``.
+    """
+    tomorrow = today + timedelta(days=1)
+    saturday = today - timedelta(days=(today.weekday() - 5) % 7)
+    month_start = today.replace(day=1)
+    prev_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    return {
+        "today": (today, tomorrow),
+        "week": (today - timedelta(days=6), tomorrow),                       # آخر 7 أيام
+        "prev_week": (today - timedelta(days=13), today - timedelta(days=6)),
+        "cal_week": (saturday, tomorrow),                                    # من السبت
+        "prev_cal_week": (saturday - timedelta(days=7), saturday),
+        "month": (month_start, next_month_start),
+        "prev_month": (prev_month_start, month_start),
+    }
+
+
+@cached("sales", "expenses", ttl=TTL_REPORT)
+def period_totals(today):
+    """
+    Totals for every report period from ``daily_summary`` in one query: a
+    range scan over at most ~62 day rows, with one ``FILTER`` per period.
+    """
+    periods = report_periods(today)
+    params = {"lower": min(r[0] for r in periods.values()), "upper": max(r[1] for r in periods.values())}
+    columns = []
+    for p, (start, end) in periods.items():
+        params[f"{p}_start"], params[f"{p}_end"] = start, end
+        where = f"day >= %({p}_start)s AND day < %({p}_end)s"
+        for col in ("revenue", "profit", "invoices", "units", "expenses"):
+            columns.append(f"COALESCE(SUM({col}) FILTER (WHERE {where}), 0) AS {p}_{col}")
+    row = _read(f"""
+        SELECT {", ".join(columns)}
+        FROM public.daily_summary
+        WHERE day >= %(lower)s AND day < %(upper)s
+    """, params=params).iloc[0]
+    return {
+        p: {col: row[f"{p}_{col}"] for col in ("revenue", "profit", "invoices", "units", "expenses")}
+        for p in REPORT_PERIODS
+    }
+
+
+def sales_summary(today):
+    """``{period: [revenue, profit, invoices]}`` for the Baghdad date ``today``."""
+    totals = period_totals(today)
+    return {p: [float(t["revenue"]), float(t["profit"]), int(t["invoices"])] for p, t in totals.items()}
+
+
+def expense_summary(today):
+    """``{period: amount}`` for the Baghdad date ``today``."""
+    return {p: float(t["expenses"]) for p, t in period_totals(today).items()}
+
+
+@cached("variants", ttl=TTL_REPORT)
+def stock_value():
+    return _read("""
+        SELECT SUM(stock * cost) as total_cost, SUM(stock * price) as total_revenue FROM public.variants
+    """).iloc[0]
+
+
+@cached("sales", ttl=TTL_REPORT)
+def top_items(limit=10):
+    return _read("""
+        SELECT
+            SUM(profit) as total_profit,
+            SUM(total) as total_sales,
+            SUM(qty) as total_qty,
+            product_name as name
+        FROM public.sales
+        GROUP BY product_name
+        ORDER BY SUM(profit) DESC
+        LIMIT %s
+    """, params=(limit,))
+
+
+@cached("sales", "customers", ttl=TTL_REPORT)
+def top_customers(limit=10):
+    return _read("""
+        SELECT
+            SUM(s.total) as total_spend,
+            COUNT(s.id) as orders_count,
+            c.name as name
+        FROM public.sales s
+        JOIN public.customers c ON s.customer_id = c.id
+        GROUP BY c.name
+        ORDER BY SUM(s.total) DESC
+        LIMIT %s
+    """, params=(limit,))
+
+
+@cached("sales", "variants", ttl=TTL_REPORT)
+def top_colors(limit=5):
+    return _read("""
+        SELECT v.color, SUM(s.qty) as qty
+        FROM public.sales s
+        JOIN public.variants v ON s.variant_id = v.id
+        GROUP BY v.color
+        ORDER BY qty DESC LIMIT %s
+    """, params=(limit,))
+
+
+@cached("sales", "variants", ttl=TTL_REPORT)
+def top_sizes(limit=5):
+    return _read("""
+        SELECT v.size, SUM(s.qty) as qty
+        FROM public.sales s
+        JOIN public.variants v ON s.variant_id = v.id
+        GROUP BY v.size
+        ORDER BY qty DESC LIMIT %s
+    """, params=(limit,))
@@ -0,0 +1,153 @@
+"""
+Pooled Postgres connections for all sessions in the process.
+
+Reads and transactions check a connection out only for their own duration, so
+concurrent sessions no longer queue on one socket, a failed statement only
+rolls back its own transaction, and a connection dropped by the pooler is
+replaced on the next checkout instead of breaking the app until restart.
+
+Pool sizes come from an optional ``[pool]`` section in secrets::
+
+    [pool]
+    minconn = 2       # idle connections kept open
+    maxconn = 10      # hard cap; checkouts wait up to `timeout` seconds
+    timeout = 10
+    check_after = 30  # ping connections idle longer than this (seconds)
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+import streamlit as st
+from psycopg2 import extensions, pool
+
+import sqltrace
+
+POOL_DEFAULTS = {"minconn": 2, "maxconn": 10, "timeout": 10, "check_after": 30}
+
+# أخطاء تعني أن الاتصال نفسه مقطوع (وليس خطأ في الاستعلام)
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class ConnectionPool:
+    """
+    ``ThreadedConnectionPool`` with blocking checkout and liveness checks.
+
+    psycopg2's pool raises as soon as ``maxconn`` is reached; this wrapper
+    waits for a free slot instead, and pings connections that sat idle for
+    longer than ``check_after`` seconds before handing them out.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=10, check_after=30, **params):
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **params)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._returned_at = {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise pool.PoolError("connection pool exhausted")
+        try:
+            # بعد انقطاع الـ pooler تكون كل الاتصالات الخاملة مقطوعة غالباً: نغلقها واحداً
+            # واحداً حتى نجد اتصالاً حياً أو يفتح الـ pool اتصالاً جديداً
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_alive(conn):
+                    return conn
+                self._returned_at.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("no live connection available")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            close = True
+        try:
+            self._pool.putconn(conn, close=close or bool(conn.closed))
+            self._returned_at[id(conn)] = time.monotonic()
+        finally:
+            self._slots.release()
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        returned_at = self._returned_at.get(id(conn))
+        if returned_at is not None and time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+@st.cache_resource
+def get_pool():
+    settings = {**POOL_DEFAULTS, **st.secrets.get("pool", {})}
+    return ConnectionPool(**settings, cursor_factory=sqltrace.TracingCursor, **st.secrets["postgres"])
+
+
+def is_connection_error(exc):
+    # pd.read_sql يغلّف أخطاء psycopg2 داخل DatabaseError
+    return isinstance(exc, CONNECTION_ERRORS) or isinstance(exc.__cause__, CONNECTION_ERRORS)
+
+
+@contextmanager
+def connection():
+    """Checks a connection out of the pool for the duration of the block."""
+    p = get_pool()
+    conn = p.getconn()
+    broken = False
+    try:
+        yield conn
+    except Exception as e:
+        broken = is_connection_error(e)
+        raise
+    finally:
+        p.putconn(conn, close=broken)
+
+
+@contextmanager
+def transaction():
+    """
+    Yields a cursor inside a transaction that commits when the block exits
+    normally and rolls back on any exception.
+    """
+    with connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+            raise
+
+
+def read_sql(query, params=None):
+    """``pd.read_sql`` on a pooled connection, retried once if the connection dropped."""
+    try:
+        with connection() as conn:
+            return pd.read_sql(query, conn, params=params)
+    except Exception as e:
+        if not is_connection_error(e):
+            raise
+    with connection() as conn:
+        return pd.read_sql(query, conn, params=params)
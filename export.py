@@ -0,0 +1,147 @@
+"""
+Full-history exports streamed from server-side cursors.
+
+Each export is one query run through a named cursor, so Postgres hands the
+rows over ``CHUNK_ROWS`` at a time instead of materialising the history as
+a DataFrame. Rows are written as they arrive: CSV through ``csv.writer``,
+XLSX through openpyxl's write-only workbook, both into a spooled temporary
+file that moves to disk past ``SPOOL_BYTES``.
+
+Memory is not constant: the builders return the finished file as ``bytes``
+and ``st.download_button`` keeps that payload in memory to serve it, so a
+download costs about the size of the exported file (much less than the
+same rows as Python objects, but it grows with the history).
+"""
+import csv
+import io
+import tempfile
+
+import db
+
+CHUNK_ROWS = 2000
+SPOOL_BYTES = 2 * 1024 * 1024
+
+# (SQL expression, column header) for each export; sales uses the log tab's joins
+EXPORTS = {
+    "sales": {
+        "title": "المبيعات",
+        "columns": [
+            ("s.id", "رقم العملية"), ("s.invoice_id", "الفاتورة"), ("s.date", "التاريخ"),
+            ("c.name", "الزبون"), ("c.phone", "الهاتف"), ("s.product_name", "المنتج"),
+            ("v.color", "اللون"), ("v.size", "القياس"), ("s.qty", "العدد"),
+            ("s.total", "الإجمالي"), ("s.profit", "الربح"), ("s.delivery_duration", "مدة التوصيل"),
+        ],
+        "from": """public.sales s
+            LEFT JOIN public.customers c ON s.customer_id = c.id
+            LEFT JOIN public.variants v ON s.variant_id = v.id""",
+        "date": "s.date",
+        "order": "s.id",
+    },
+    "returns": {
+        "title": "الرواجع",
+        "columns": [
+            ("r.id", "الرقم"), ("r.return_date", "التاريخ"), ("r.sale_id", "رقم العملية"),
+            ("c.name", "الزبون"), ("r.product_name", "المنتج"), ("r.product_details", "التفاصيل"),
+            ("r.qty", "العدد"), ("r.return_amount", "مبلغ الاسترجاع"), ("r.status", "الحالة"),
+        ],
+        "from": "public.returns r LEFT JOIN public.customers c ON r.customer_id = c.id",
+        "date": "r.return_date",
+        "order": "r.id",
+    },
+    "expenses": {
+        "title": "المصاريف",
+        "columns": [("id", "الرقم"), ("date", "التاريخ"), ("amount", "المبلغ"), ("reason", "السبب")],
+        "from": "public.expenses",
+        "date": "date",
+        "order": "id",
+    },
+    "inventory": {
+        "title": "المخزون",
+        "columns": [
+            ("id", "الرقم"), ("name", "المنتج"), ("color", "اللون"), ("size", "القياس"),
+            ("stock", "العدد"), ("cost", "التكلفة"), ("price", "سعر البيع"),
+        ],
+        "from": "public.variants",
+        "date": None,
+        "order": "name, color, size",
+    },
+}
+
+
+def export_query(kind, day_from=None, day_to=None):
+    """``(sql, params)`` for one export; the day bounds are inclusive Asia/Baghdad dates."""
+    spec = EXPORTS[kind]
+    where, params = [], {}
+    if spec["date"] and day_from is not None:
+        where.append(f"{spec['date']} >= (%(day_from)s::timestamp AT TIME ZONE 'Asia/Baghdad')")
+        params["day_from"] = day_from
+    if spec["date"] and day_to is not None:
+        where.append(f"{spec['date']} < ((%(day_to)s::date + 1)::timestamp AT TIME ZONE 'Asia/Baghdad')")
+        params["day_to"] = day_to
+    sql = (
+        f"SELECT {', '.join(expr for expr, _ in spec['columns'])} FROM {spec['from']}"
+        + (f" WHERE {' AND '.join(where)}" if where else "")
+        + f" ORDER BY {spec['order']}"
+    )
+    return sql, params
+
+
+def headers(kind):
+    return [label for _, label in EXPORTS[kind]["columns"]]
+
+
+def iter_chunks(kind, day_from=None, day_to=None, chunk=CHUNK_ROWS):
+    """Yields the export's rows in lists of at most ``chunk`` tuples from a server-side cursor."""
+    sql, params = export_query(kind, day_from, day_to)
+    with db.connection() as conn:
+        try:
+            # المؤشر المسمى يبقى في الخادم ويُقرأ دفعة دفعة داخل المعاملة
+            with conn.cursor(name=f"export_{kind}") as cur:
+                cur.itersize = chunk
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(chunk)
+                    if not rows:
+                        break
+                    yield rows
+        finally:
+            conn.rollback()
+
+
+def to_csv(kind, day_from=None, day_to=None):
+    """The export as UTF-8 CSV bytes (with BOM, so Excel reads the Arabic)."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as out:
+        text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+        writer = csv.writer(text)
+        writer.writerow(headers(kind))
+        for rows in iter_chunks(kind, day_from, day_to):
+            writer.writerows(rows)
+        text.flush()
+        text.detach()
+        out.seek(0)
+        # download_button لا يقبل SpooledTemporaryFile، فنعيد المحتوى كـ bytes
+        return out.read()
+
+
+def to_xlsx(kind, day_from=None, day_to=None):
+    """The export as XLSX workbook bytes. Needs ``openpyxl``."""
+    # openpyxl يُستورد عند الطلب فقط: التطبيق يعمل بدونه ما عدا تصدير Excel
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(EXPORTS[kind]["title"])
+    sheet.sheet_view.rightToLeft = True
+    sheet.append(headers(kind))
+    for rows in iter_chunks(kind, day_from, day_to):
+        for row in rows:
+            sheet.append(row)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as out:
+        workbook.save(out)
+        out.seek(0)
+        return out.read()
+
+
+FORMATS = {
+    "csv": (to_csv, "text/csv"),
+    "xlsx": (to_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
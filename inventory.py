@@ -0,0 +1,64 @@
+"""
+Set-based writes to ``public.variants``: bulk restock and batched edits.
+"""
+from psycopg2.extras import execute_values
+
+
+def upsert_variants(cur, rows):
+    """
+    Applies a restock matrix in one statement. ``rows`` are
+    ``(name, color, size, stock, price, cost)``: new keys are inserted,
+    existing ones get ``stock`` added and price/cost replaced.
+
+    Returns ``(added, updated)``.
+    """
+    # نفس المفتاح لا يجوز أن يتكرر داخل INSERT ... ON CONFLICT واحد
+    merged = {}
+    for name, color, size, stock, price, cost in rows:
+        key = (name, color, size)
+        prev = merged.get(key)
+        merged[key] = (int(stock) + (prev[0] if prev else 0), float(price), float(cost))
+    if not merged:
+        return 0, 0
+    result = execute_values(cur, """
+        INSERT INTO public.variants AS v (name, color, size, stock, price, cost) VALUES %s
+        ON CONFLICT (name, color, size) DO UPDATE SET
+            stock = COALESCE(v.stock, 0) + EXCLUDED.stock,
+            price = EXCLUDED.price,
+            cost = EXCLUDED.cost
+        RETURNING (xmax = 0)
+    """, [(*key, *vals) for key, vals in merged.items()], page_size=len(merged), fetch=True)
+    added = sum(1 for (inserted,) in result if inserted)
+    return added, len(result) - added
+
+
+# الأعمدة القابلة للتعديل في نافذة "تعديل الكميات"
+EDITABLE_COLUMNS = ["stock", "price", "cost", "color", "size"]
+
+
+def changed_rows(original, edited, columns=EDITABLE_COLUMNS):
+    """
+    Returns the rows of ``edited`` (matched to ``original`` by ``id``) whose
+    editable columns differ, so unchanged variants are never written.
+    """
+    after = edited.set_index("id")[columns]
+    before = original.set_index("id")[columns].reindex(after.index)
+    same = (after == before) | (after.isna() & before.isna())
+    return after[~same.all(axis=1)].reset_index()
+
+
+def update_variants(cur, changed):
+    """Writes the rows from ``changed_rows`` with one ``UPDATE ... FROM (VALUES ...)``."""
+    rows = [
+        (int(r["id"]), int(r["stock"]), float(r["price"]), float(r["cost"]), r["color"], r["size"])
+        for r in changed.to_dict("records")
+    ]
+    if not rows:
+        return 0
+    execute_values(cur, """
+        UPDATE public.variants AS v
+        SET stock = d.stock, price = d.price, cost = d.cost, color = d.color, size = d.size
+        FROM (VALUES %s) AS d(id, stock, price, cost, color, size)
+        WHERE v.id = d.id
+    """, rows, template="(%s::int, %s::int, %s::real, %s::real, %s::text, %s::text)", page_size=len(rows))
+    return len(rows)
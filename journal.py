@@ -0,0 +1,292 @@
+"""
+Local write-ahead journal for checkout.
+
+When ``[journal] enabled = true`` a checkout is committed to a local SQLite
+file and confirmed to the cashier without waiting on Postgres. A background
+``Flusher`` replays pending orders in order, each in one Postgres
+transaction that also inserts the order key into ``public.applied_orders``,
+so an order that was applied but not marked locally (crash, lost reply) is
+recognised and skipped on the next attempt.
+
+Until an order is applied its quantities count as reserved: ``reserved()``
+is subtracted from the stock the sale screen shows and checks against. An
+applied order stays reserved against any stock figure read before it was
+applied (cart lines and cached searches carry their ``read_at`` time), so
+the same units are never counted as available twice.
+
+    [journal]
+    enabled = true
+    path = "checkout_journal.db"
+    retry_seconds = 5
+"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+import checkout
+import data
+import db
+
+JOURNAL_DEFAULTS = {"enabled": False, "path": "checkout_journal.db", "retry_seconds": 5}
+
+# أخطاء غير الاتصال تُعاد بهذا العدد ثم يُرفض الطلب
+MAX_ATTEMPTS = 5
+
+
+class Journal:
+    """Pending and finished orders in a local SQLite file."""
+
+    flusher = None
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS orders (
+                    order_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    applied_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS order_lines (
+                    order_key TEXT NOT NULL REFERENCES orders(order_key),
+                    variant_id INTEGER NOT NULL,
+                    qty INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS orders_status_idx ON orders (status, created_at);
+                CREATE INDEX IF NOT EXISTS order_lines_key_idx ON order_lines (order_key);
+            """)
+            # ملفات أُنشئت قبل إضافة العمود
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(orders)")}
+            if "applied_at" not in columns:
+                conn.execute("ALTER TABLE orders ADD COLUMN applied_at REAL")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS orders_applied_idx ON orders (applied_at) WHERE status = 'applied'"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def record_checked(self, customer_id, new_customer, cart, when, invoice_id, delivery_duration):
+        """
+        Checks the cart against the stock it was read with (see
+        ``_check_stock``) and durably stores the order in the same
+        ``BEGIN IMMEDIATE`` transaction, so two sessions cannot both confirm
+        the last units. Raises ``checkout.OutOfStock`` without storing
+        anything; otherwise wakes the flusher and returns the order key.
+        """
+        key = uuid.uuid4().hex
+        payload = {
+            "customer_id": customer_id,
+            "new_customer": new_customer,
+            "cart": cart,
+            "when": when.isoformat(),
+            "invoice_id": invoice_id,
+            "delivery_duration": delivery_duration,
+        }
+        conn = self._connect()
+        try:
+            # قفل الكتابة يؤخذ قبل التحقق: جلسة أخرى تنتظر حتى يُحفظ هذا الطلب ثم ترى حجزه
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_stock(conn, cart)
+                conn.execute(
+                    "INSERT INTO orders (order_key, payload, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(payload, ensure_ascii=False), time.time())
+                )
+                conn.executemany(
+                    "INSERT INTO order_lines (order_key, variant_id, qty) VALUES (?, ?, ?)",
+                    [(key, int(x['id']), int(x['qty'])) for x in cart]
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        if self.flusher is not None:
+            self.flusher.wake.set()
+        return key
+
+    def pending(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT order_key, payload, attempts FROM orders WHERE status = 'pending' ORDER BY created_at"
+            ).fetchall()
+        return [(key, json.loads(payload), attempts) for key, payload, attempts in rows]
+
+    def reserved(self, since=None):
+        """
+        ``{variant_id: qty}`` that a stock figure read at ``since`` (a
+        ``time.time()`` value) does not reflect yet: orders still pending,
+        plus orders applied to Postgres after that read. ``None`` means a
+        read taken now, i.e. only pending orders.
+        """
+        with self._connect() as conn:
+            return self._reserved(conn, since)
+
+    def _reserved(self, conn, since):
+        return dict(conn.execute("""
+            SELECT l.variant_id, SUM(l.qty) FROM order_lines l
+            JOIN orders o ON o.order_key = l.order_key
+            WHERE o.status = 'pending' OR (o.status = 'applied' AND o.applied_at > ?)
+            GROUP BY l.variant_id
+        """, (since if since is not None else time.time(),)).fetchall())
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status").fetchall())
+
+    def rejected(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT order_key, payload, last_error FROM orders WHERE status = 'rejected' ORDER BY created_at"
+            ).fetchall()
+        return [(key, json.loads(payload), error) for key, payload, error in rows]
+
+    def set_status(self, key, status, error=None, attempt=False):
+        """``attempt`` counts a failed replay toward ``MAX_ATTEMPTS``; connection errors don't."""
+        with self._connect() as conn:
+            conn.execute(
+                """UPDATE orders SET status = ?, attempts = attempts + ?, last_error = ?,
+                   applied_at = CASE WHEN ? = 'applied' THEN ? ELSE applied_at END
+                   WHERE order_key = ?""",
+                (status, int(attempt), error, status, time.time(), key)
+            )
+
+    def _check_stock(self, conn, cart):
+        """
+        Raises ``checkout.OutOfStock`` when a cart line asks for more than the
+        stock seen when it was added (its ``read_at``) minus what that
+        figure does not reflect yet.
+        """
+        requested, lines = {}, {}
+        for x in cart:
+            variant_id = int(x['id'])
+            requested[variant_id] = requested.get(variant_id, 0) + int(x['qty'])
+            # أحدث قراءة للمخزون بين أسطر نفس الصنف
+            if variant_id not in lines or x.get('read_at', 0) > lines[variant_id].get('read_at', 0):
+                lines[variant_id] = x
+        reserved_by_read = {}
+        short = []
+        for variant_id, qty in requested.items():
+            read_at = lines[variant_id].get('read_at')
+            if read_at not in reserved_by_read:
+                reserved_by_read[read_at] = self._reserved(conn, read_at)
+            available = int(lines[variant_id].get('stock', qty)) - reserved_by_read[read_at].get(variant_id, 0)
+            if qty > available:
+                x = lines[variant_id]
+                short.append({
+                    "id": variant_id, "name": x['name'], "color": x['color'], "size": x['size'],
+                    "requested": qty, "available": max(available, 0),
+                })
+        if short:
+            raise checkout.OutOfStock(short)
+
+
+def apply(cur, key, order):
+    """
+    Replays one journaled order in the caller's transaction. Returns
+    ``False`` if ``applied_orders`` shows it was already applied.
+    """
+    cur.execute(
+        "INSERT INTO public.applied_orders (order_key, invoice_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        (key, order["invoice_id"])
+    )
+    if cur.rowcount == 0:
+        return False
+    customer_id = order["customer_id"]
+    if customer_id is None:
+        c = order["new_customer"]
+        customer_id = checkout.find_or_create_customer(cur, c["name"], c["phone"], c["address"], c["username"])
+    checkout.place_order(
+        cur, customer_id, order["cart"], datetime.fromisoformat(order["when"]),
+        order["invoice_id"], order["delivery_duration"]
+    )
+    return True
+
+
+class Flusher(threading.Thread):
+    """
+    Replays pending orders to Postgres in journal order. A connection error
+    stops the pass and waits ``retry_seconds``; an order that keeps failing
+    for another reason (out of stock, bad data) is marked rejected.
+    """
+
+    def __init__(self, journal, pool, retry_seconds=5, on_applied=None):
+        super().__init__(name="journal-flusher", daemon=True)
+        self.journal = journal
+        self.pool = pool
+        self.retry_seconds = retry_seconds
+        self.on_applied = on_applied
+        self.wake = threading.Event()
+
+    def run(self):
+        while True:
+            self.flush()
+            self.wake.wait(self.retry_seconds)
+            self.wake.clear()
+
+    def flush(self):
+        applied = 0
+        for key, order, attempts in self.journal.pending():
+            try:
+                conn = self.pool.getconn()
+            except Exception:
+                break
+            broken = False
+            try:
+                with conn.cursor() as cur:
+                    apply(cur, key, order)
+                conn.commit()
+            except Exception as e:
+                broken = db.is_connection_error(e)
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+                if broken:
+                    self.journal.set_status(key, "pending", str(e))
+                    break
+                final = isinstance(e, checkout.OutOfStock) or attempts + 1 >= MAX_ATTEMPTS
+                self.journal.set_status(key, "rejected" if final else "pending", str(e), attempt=True)
+                continue
+            finally:
+                self.pool.putconn(conn, close=broken)
+            self.journal.set_status(key, "applied")
+            applied += 1
+            # كل طلب مطبق يبطل الكاش فوراً حتى لا تبقى قراءات المخزون القديمة
+            if self.on_applied:
+                self.on_applied()
+        return applied
+
+
+def settings():
+    return {**JOURNAL_DEFAULTS, **st.secrets.get("journal", {})}
+
+
+@st.cache_resource
+def get_journal():
+    """The process-wide journal with its flusher running, or ``None`` when the mode is off."""
+    config = settings()
+    if not config["enabled"]:
+        return None
+    journal = Journal(config["path"])
+    journal.flusher = Flusher(
+        journal, db.get_pool(), config["retry_seconds"],
+        on_applied=lambda: data.invalidate("variants", "sales", "customers")
+    )
+    journal.flusher.start()
+    return journal
@@ -0,0 +1,122 @@
+"""
+Cross-session cache invalidation through Postgres LISTEN/NOTIFY.
+
+Migration 10 puts statement-level triggers on the tables the cached reads
+depend on; each write sends the table name on ``migrations.CHANGE_CHANNEL``.
+One ``Listener`` thread per process holds a dedicated connection, waits on
+that channel and calls ``data.invalidate`` with the tables that changed, so
+a sale made in one session clears exactly the affected reads in every other
+session without them polling. Between notifications nothing is queried.
+
+The listener is opt-in, like the checkout journal: it opens a connection
+outside the pool, and LISTEN needs a session connection. Behind a
+transaction-mode pooler notifications are never delivered, so point
+``dsn`` at the direct or session-mode address::
+
+    [livesync]
+    enabled = true
+    dsn = "postgresql://..."   # optional, defaults to [postgres]
+"""
+import select
+import threading
+import time
+
+import psycopg2
+import streamlit as st
+from psycopg2 import extensions
+
+import data
+from migrations import CHANGE_CHANNEL, NOTIFY_TABLES
+
+LIVESYNC_DEFAULTS = {"enabled": False, "dsn": None}
+
+# انتظار قبل إعادة الاتصال بعد انقطاعه (يتضاعف حتى الحد الأقصى)
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+# مهلة select حتى يلاحظ الخيط طلب الإيقاف
+POLL_SECONDS = 5
+
+
+class Listener(threading.Thread):
+    """Listens on the change channel and invalidates the cached reads of each changed table."""
+
+    def __init__(self, connect_params):
+        super().__init__(name="livesync-listener", daemon=True)
+        self.connect_params = connect_params
+        self.stopping = threading.Event()
+        self.connected = False
+        self.notifications = 0
+        self.connections = 0
+        self.last_tables = ()
+        self.last_at = None
+        self.last_error = None
+
+    def run(self):
+        delay = RECONNECT_MIN
+        while not self.stopping.is_set():
+            try:
+                self._listen()
+                delay = RECONNECT_MIN
+            except Exception as e:
+                # الخيط لا يتوقف أبداً؛ الخطأ يظهر في لوحة المشرف
+                self.last_error = str(e).strip() or type(e).__name__
+            self.connected = False
+            self.stopping.wait(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    def _listen(self):
+        conn = psycopg2.connect(**self.connect_params)
+        try:
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANGE_CHANNEL}")
+            if self.connections:
+                # الإشعارات أثناء الانقطاع ضاعت: نبطل كل ما يتابعه المستمع
+                self._apply(NOTIFY_TABLES)
+            self.connections += 1
+            self.connected = True
+            while not self.stopping.is_set():
+                if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                tables = {n.payload for n in conn.notifies if n.channel == CHANGE_CHANNEL}
+                self.notifications += len(conn.notifies)
+                conn.notifies.clear()
+                if tables:
+                    self._apply(tables)
+        finally:
+            conn.close()
+
+    def _apply(self, tables):
+        tables = tuple(sorted(tables))
+        data.invalidate(*tables)
+        self.last_tables = tables
+        self.last_at = time.time()
+
+    def stop(self):
+        self.stopping.set()
+
+    def status(self):
+        return {
+            "connected": self.connected,
+            "notifications": self.notifications,
+            "last_tables": ", ".join(self.last_tables),
+            "last_at": time.strftime("%H:%M:%S", time.localtime(self.last_at)) if self.last_at else None,
+            "last_error": self.last_error,
+        }
+
+
+def settings():
+    return {**LIVESYNC_DEFAULTS, **st.secrets.get("livesync", {})}
+
+
+@st.cache_resource
+def get_listener():
+    """The process-wide listener thread, or ``None`` when disabled in secrets."""
+    config = settings()
+    if not config["enabled"]:
+        return None
+    params = {"dsn": config["dsn"]} if config["dsn"] else dict(st.secrets["postgres"])
+    listener = Listener(params)
+    listener.start()
+    return listener
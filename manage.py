@@ -0,0 +1,95 @@
+"""
+Maintenance commands that run outside Streamlit.
+
+    python manage.py migrate          # apply pending schema migrations
+    python manage.py status           # show applied / pending versions
+    python manage.py check-indexes    # EXPLAIN the hot queries, flag full scans
+    python manage.py rebuild-summary  # backfill daily_summary
+    python manage.py rebuild-customer-stats  # backfill customer_stats
+
+The database is taken from --dsn, then $DATABASE_URL, then the [postgres]
+section of .streamlit/secrets.toml.
+"""
+import argparse
+import os
+import sys
+
+import psycopg2
+
+import migrations
+import summary
+
+
+def connect(dsn=None):
+    dsn = dsn or os.environ.get("DATABASE_URL")
+    if dsn:
+        return psycopg2.connect(dsn)
+    import streamlit as st
+    return psycopg2.connect(**st.secrets["postgres"])
+
+
+def cmd_migrate(conn, args):
+    applied = migrations.migrate(conn)
+    if applied:
+        print("applied:", ", ".join(str(v) for v in applied))
+    else:
+        print("schema is up to date")
+
+
+def cmd_status(conn, args):
+    done = migrations.applied_versions(conn)
+    for version, description, _ in migrations.MIGRATIONS:
+        mark = "x" if version in done else " "
+        print(f"[{mark}] {version:>3}  {description}")
+
+
+def cmd_check_indexes(conn, args):
+    ok = True
+    for row in migrations.check_indexes(conn):
+        if row["seq_scans"]:
+            ok = False
+            print(f"SEQ  {row['query']}: full scan on {', '.join(row['seq_scans'])}")
+        else:
+            print(f"ok   {row['query']}: {', '.join(row['indexes']) or '-'}")
+    if not ok:
+        sys.exit(1)
+
+
+def cmd_rebuild_summary(conn, args):
+    with conn.cursor() as cur:
+        days = summary.rebuild(cur)
+    conn.commit()
+    print(f"daily_summary rebuilt: {days} days")
+
+
+def cmd_rebuild_customer_stats(conn, args):
+    with conn.cursor() as cur:
+        customers = summary.rebuild_customer_stats(cur)
+    conn.commit()
+    print(f"customer_stats rebuilt: {customers} customers")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Nawaem maintenance commands")
+    parser.add_argument("--dsn", help="Postgres connection string")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending schema migrations").set_defaults(func=cmd_migrate)
+    commands.add_parser("status", help="list schema versions").set_defaults(func=cmd_status)
+    commands.add_parser("check-indexes", help="verify hot queries can use an index").set_defaults(func=cmd_check_indexes)
+    commands.add_parser("rebuild-summary", help="recompute daily_summary from sales and expenses").set_defaults(func=cmd_rebuild_summary)
+    commands.add_parser("rebuild-customer-stats", help="recompute customer_stats from customers and sales").set_defaults(func=cmd_rebuild_customer_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    conn = connect(args.dsn)
+    try:
+        args.func(conn, args)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
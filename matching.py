@@ -0,0 +1,139 @@
+"""
+Text normalization and fuzzy matching for product names and colors.
+
+``normalize`` folds the Arabic spelling variants staff type interchangeably
+(alef/hamza forms, taa marbuta, yaa/alef maqsura, tatweel, diacritics) so
+"بلوزه" and "بلوزة" compare equal. ``Matcher`` indexes existing values by
+character trigrams of their normalized form and only scores the few
+candidates that share the most trigrams with the input.
+"""
+import re
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+# التشكيل وعلامات القرآن
+_DIACRITICS = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]")
+_TATWEEL = "\u0640"
+_SPACES = re.compile(r"\s+")
+_LETTER_FOLD = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي", "ی": "ي", "ئ": "ي",
+    "ؤ": "و",
+    "ک": "ك",
+})
+
+
+def clean_text(text):
+    """Removes tatweel and diacritics and collapses whitespace, keeping the spelling."""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text.replace(_TATWEEL, ""))
+    return _SPACES.sub(" ", text).strip()
+
+
+def normalize(text):
+    """Comparison key: ``clean_text`` plus case and Arabic letter-form folding."""
+    return clean_text(text).casefold().translate(_LETTER_FOLD)
+
+
+def _grams(key, n=3):
+    padded = f" {key} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class Matcher:
+    """
+    Fuzzy lookup over a fixed set of existing values.
+
+    Exact matches on the normalized key are a dict hit; otherwise the
+    ``shortlist`` values sharing the most trigrams are scored with
+    ``SequenceMatcher`` and the best one is returned if it reaches the
+    threshold.
+    """
+
+    def __init__(self, values=(), shortlist=20):
+        self.shortlist = shortlist
+        self._values = []
+        self._keys = []
+        self._exact = {}
+        self._index = defaultdict(list)
+        for value in values:
+            self.add(value)
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value):
+        if not value:
+            return
+        key = normalize(value)
+        if key in self._exact:
+            return
+        pos = len(self._values)
+        self._values.append(value)
+        self._keys.append(key)
+        self._exact[key] = value
+        for gram in _grams(key):
+            self._index[gram].append(pos)
+
+    def best(self, value):
+        """Returns ``(existing_value, ratio)`` for the closest value, or ``(None, 0.0)``."""
+        key = normalize(value)
+        if not key:
+            return None, 0.0
+        if key in self._exact:
+            return self._exact[key], 1.0
+        overlap = Counter()
+        for gram in _grams(key):
+            overlap.update(self._index.get(gram, ()))
+        best_value, best_ratio = None, 0.0
+        for pos, _ in overlap.most_common(self.shortlist):
+            ratio = SequenceMatcher(None, key, self._keys[pos]).ratio()
+            if ratio > best_ratio:
+                best_value, best_ratio = self._values[pos], ratio
+        return best_value, best_ratio
+
+    def match(self, value, threshold=0.85):
+        """Returns the existing value ``value`` should be merged into, or ``value`` itself."""
+        if not value:
+            return value
+        found, ratio = self.best(value)
+        return found if ratio >= threshold else value
+
+
+def parse_multi_input(text):
+    """
+    Parses a string containing multiple values separated by commas, hyphens, or spaces.
+    Returns a list of clean strings.
+    """
+    # Text normalization (same cleaning the matcher applies before folding)
+    text = clean_text(text)
+    if not text:
+        return []
+
+    # Check for specific separators
+    if ',' in text or '،' in text:
+        # Split by comma (both English and Arabic)
+        parts = re.split(r'[,،]', text)
+    elif '-' in text:
+        # Split by hyphen
+        parts = text.split('-')
+    else:
+        # Split by whitespace
+        parts = text.split()
+
+    # Clean up results
+    return [p.strip() for p in parts if p.strip()]
+
+
+def fuzzy_match(new_val, existing_vals, threshold=0.85):
+    """
+    Checks if new_val is similar to any item in existing_vals.
+    Returns the existing item if match found, otherwise returns new_val.
+    Pass a ``Matcher`` to reuse its index across calls.
+    """
+    matcher = existing_vals if isinstance(existing_vals, Matcher) else Matcher(existing_vals)
+    return matcher.match(new_val, threshold)
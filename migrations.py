@@ -0,0 +1,309 @@
+"""
+Versioned schema migrations.
+
+Every schema change is an entry in ``MIGRATIONS``: a version number, a short
+description and a list of steps. A step is either a SQL string or a callable
+that receives the cursor. ``migrate`` applies the pending versions in order,
+one transaction each, and records them in ``public.schema_version``.
+
+The app runs ``migrate`` once per process; ``python manage.py migrate`` does
+the same from the command line.
+"""
+import psycopg2
+
+import summary
+
+# مفتاح القفل الاستشاري حتى لا تطبق عمليتان نفس الترحيل بالتوازي
+LOCK_KEY = 7_262_001
+
+# نص البحث عن الأصناف؛ data.search_variants يستخدم نفس التعبير حرفياً ليُستخدم الفهرس
+VARIANT_SEARCH_TEXT = "(COALESCE(name, '') || ' ' || COALESCE(color, '') || ' ' || COALESCE(size, ''))"
+
+
+# نص البحث عن العملاء؛ data.load_customer_page يستخدمه بنفس الشكل
+CUSTOMER_SEARCH_TEXT = "(COALESCE(name, '') || ' ' || COALESCE(phone, '') || ' ' || COALESCE(username, ''))"
+
+
+# قناة LISTEN/NOTIFY التي يستمع لها livesync؛ الرسالة اسم الجدول الذي تغير
+CHANGE_CHANNEL = "table_changes"
+NOTIFY_TABLES = ("variants", "sales", "returns", "expenses", "customers")
+
+
+def _change_triggers(tables):
+    """
+    Statement-level triggers, so a bulk update sends one notification per
+    table; Postgres also folds identical notifications within a transaction.
+    """
+    steps = []
+    for table in tables:
+        steps.append(f"DROP TRIGGER IF EXISTS {table}_notify_change ON public.{table}")
+        steps.append(
+            f"""CREATE TRIGGER {table}_notify_change
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.{table}
+                FOR EACH STATEMENT EXECUTE FUNCTION public.notify_table_change()"""
+        )
+    return steps
+
+
+def _trigram_index(name, table, expression, where=None):
+    """
+    Step that creates a trigram GIN index on ``expression``. Servers without
+    the ``pg_trgm`` extension skip it and the search falls back to filtering
+    rows reached through the other indexes.
+    """
+    def step(cur):
+        cur.execute("SAVEPOINT trigram_index")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON public.{table} USING gin ({expression} gin_trgm_ops)"
+                + (f" WHERE {where}" if where else "")
+            )
+        except psycopg2.Error:
+            cur.execute("ROLLBACK TO SAVEPOINT trigram_index")
+        cur.execute("RELEASE SAVEPOINT trigram_index")
+    return step
+
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """CREATE TABLE IF NOT EXISTS public.variants (
+            id SERIAL PRIMARY KEY, name TEXT, color TEXT, size TEXT, cost REAL, price REAL, stock INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS public.customers (
+            id SERIAL PRIMARY KEY, name TEXT, phone TEXT, address TEXT, username TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS public.sales (
+            id SERIAL PRIMARY KEY, customer_id INTEGER, variant_id INTEGER, product_name TEXT,
+            qty INTEGER, total REAL, profit REAL, date TIMESTAMP, invoice_id TEXT, delivery_duration TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS public.expenses (
+            id SERIAL PRIMARY KEY, amount REAL, reason TEXT, date TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS public.returns (
+            id SERIAL PRIMARY KEY, sale_id INTEGER, variant_id INTEGER, customer_id INTEGER,
+            product_name TEXT, product_details TEXT, qty INTEGER, return_amount REAL,
+            return_date TIMESTAMP, status TEXT
+        )""",
+        # قواعد البيانات القديمة أنشئت قبل إضافة عمود مدة التوصيل
+        "ALTER TABLE public.sales ADD COLUMN IF NOT EXISTS delivery_duration TEXT",
+    ]),
+    (2, "indexes for sales, returns, expenses and variants lookups", [
+        # السجل والتقارير وصفحة العملاء تفلتر على التاريخ والزبون والصنف
+        "CREATE INDEX IF NOT EXISTS sales_date_idx ON public.sales (date)",
+        "CREATE INDEX IF NOT EXISTS sales_customer_id_date_idx ON public.sales (customer_id, date)",
+        "CREATE INDEX IF NOT EXISTS sales_variant_id_idx ON public.sales (variant_id)",
+        "CREATE INDEX IF NOT EXISTS expenses_date_idx ON public.expenses (date)",
+        # فحص التكرار قبل إضافة مرتجع يبحث بـ sale_id بغض النظر عن الحالة
+        "CREATE INDEX IF NOT EXISTS returns_sale_id_idx ON public.returns (sale_id)",
+        # طلب إرجاع معلق واحد لكل عملية بيع: المكرر يُنقل (لا يُحذف) إلى returns_duplicates قبل فرض القيد
+        """CREATE TABLE IF NOT EXISTS public.returns_duplicates (
+            LIKE public.returns, moved_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )""",
+        """WITH moved AS (
+               DELETE FROM public.returns r USING public.returns d
+               WHERE r.status = 'Pending' AND d.status = 'Pending' AND r.sale_id = d.sale_id AND r.id > d.id
+               RETURNING r.*
+           )
+           INSERT INTO public.returns_duplicates SELECT * FROM moved""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS returns_pending_sale_id_key ON public.returns (sale_id) WHERE status = 'Pending'",
+        "CREATE INDEX IF NOT EXISTS returns_pending_id_idx ON public.returns (id) WHERE status = 'Pending'",
+        "CREATE INDEX IF NOT EXISTS variants_name_color_size_idx ON public.variants (name, color, size)",
+        "CREATE INDEX IF NOT EXISTS variants_in_stock_idx ON public.variants (name, color, size) WHERE stock > 0",
+    ]),
+    (3, "daily_summary totals per Baghdad day", [
+        """CREATE TABLE IF NOT EXISTS public.daily_summary (
+            day DATE PRIMARY KEY,
+            revenue DOUBLE PRECISION NOT NULL DEFAULT 0,
+            profit DOUBLE PRECISION NOT NULL DEFAULT 0,
+            invoices INTEGER NOT NULL DEFAULT 0,
+            units INTEGER NOT NULL DEFAULT 0,
+            expenses DOUBLE PRECISION NOT NULL DEFAULT 0
+        )""",
+        # عدّ الفواتير عند البيع والحذف يبحث بـ invoice_id
+        "CREATE INDEX IF NOT EXISTS sales_invoice_id_idx ON public.sales (invoice_id)",
+        summary.rebuild,
+    ]),
+    (4, "unique variants (name, color, size)", [
+        # دمج الأصناف المكررة في أقدم سجل قبل فرض القيد
+        """CREATE TEMP TABLE variant_dups ON COMMIT DROP AS
+           SELECT id, min(id) OVER (PARTITION BY name, color, size) AS keep_id
+           FROM public.variants
+           WHERE name IS NOT NULL AND color IS NOT NULL AND size IS NOT NULL""",
+        "DELETE FROM variant_dups WHERE id = keep_id",
+        "UPDATE public.sales s SET variant_id = d.keep_id FROM variant_dups d WHERE s.variant_id = d.id",
+        "UPDATE public.returns r SET variant_id = d.keep_id FROM variant_dups d WHERE r.variant_id = d.id",
+        """UPDATE public.variants v SET stock = COALESCE(v.stock, 0) + m.extra
+           FROM (
+               SELECT d.keep_id, SUM(COALESCE(x.stock, 0)) AS extra
+               FROM variant_dups d JOIN public.variants x ON x.id = d.id
+               GROUP BY d.keep_id
+           ) m
+           WHERE v.id = m.keep_id""",
+        "DELETE FROM public.variants v USING variant_dups d WHERE v.id = d.id",
+        "DROP INDEX IF EXISTS public.variants_name_color_size_idx",
+        "CREATE UNIQUE INDEX IF NOT EXISTS variants_name_color_size_key ON public.variants (name, color, size)",
+    ]),
+    (5, "trigram search index for the sale screen", [
+        _trigram_index("variants_search_trgm_idx", "variants", VARIANT_SEARCH_TEXT, where="stock > 0"),
+    ]),
+    (6, "sales log filter by product", [
+        # صفحة السجل مرتبة بـ id تنازلياً، فالفهرس يعطي الصفحة مباشرة بدون ترتيب
+        "CREATE INDEX IF NOT EXISTS sales_product_name_id_idx ON public.sales (product_name, id)",
+    ]),
+    (7, "customer_stats lifetime totals per customer", [
+        """CREATE TABLE IF NOT EXISTS public.customer_stats (
+            customer_id INTEGER PRIMARY KEY,
+            total_spend DOUBLE PRECISION NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            last_purchase TIMESTAMP
+        )""",
+        # الدليل مرتب بمجموع الشراء تنازلياً ويُقسم لصفحات بـ (total_spend, customer_id)
+        "CREATE INDEX IF NOT EXISTS customer_stats_spend_idx ON public.customer_stats (total_spend, customer_id)",
+        _trigram_index("customers_search_trgm_idx", "customers", CUSTOMER_SEARCH_TEXT),
+        summary.rebuild_customer_stats,
+    ]),
+    (8, "customers phone lookup", [
+        # زبون "جديد" يُربط بالسجل الموجود لنفس الرقم بدل إنشاء نسخة مكررة
+        "CREATE INDEX IF NOT EXISTS customers_phone_idx ON public.customers (phone)",
+    ]),
+    (9, "applied_orders for idempotent journal replay", [
+        # مفتاح كل طلب من السجل المحلي يُدخل مع الطلب نفسه، فلا يُطبق مرتين
+        """CREATE TABLE IF NOT EXISTS public.applied_orders (
+            order_key TEXT PRIMARY KEY,
+            invoice_id TEXT,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )""",
+    ]),
+    (10, "change notifications for the live cache listener", [
+        f"""CREATE OR REPLACE FUNCTION public.notify_table_change() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                PERFORM pg_notify('{CHANGE_CHANNEL}', TG_TABLE_NAME);
+                RETURN NULL;
+            END
+            $$""",
+        *_change_triggers(NOTIFY_TABLES),
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""CREATE TABLE IF NOT EXISTS public.schema_version (
+            version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )""")
+    conn.commit()
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM public.schema_version")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.rollback()
+    return versions
+
+
+def pending(conn):
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(conn):
+    """
+    Applies every pending migration in version order and returns the list of
+    versions applied by this call.
+    """
+    applied = []
+    for version, description, steps in pending(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_KEY,))
+                # عملية أخرى ربما طبقت نفس النسخة أثناء انتظار القفل
+                cur.execute("SELECT 1 FROM public.schema_version WHERE version = %s", (version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute(
+                    "INSERT INTO public.schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# --- فحص استخدام الفهارس ---
+# استعلامات التطبيق الساخنة بنفس الشكل الذي تُرسل به من data.py و app.py
+HOT_QUERIES = [
+    ("sales log page", """
+        SELECT s.id, s.customer_id, s.variant_id, s.product_name, s.qty, s.total, s.date,
+               c.name, v.color, v.size FROM public.sales s
+        LEFT JOIN public.customers c ON s.customer_id = c.id
+        LEFT JOIN public.variants v ON s.variant_id = v.id
+        WHERE s.id < %s ORDER BY s.id DESC LIMIT 31
+    """, (1_000_000,)),
+    ("sales log by date", """
+        SELECT s.* FROM public.sales s
+        WHERE s.date >= ('2024-01-01'::timestamp AT TIME ZONE 'Asia/Baghdad')
+          AND s.date < ('2024-02-01'::timestamp AT TIME ZONE 'Asia/Baghdad')
+        ORDER BY s.id DESC LIMIT 31
+    """, None),
+    ("sales log by product", "SELECT * FROM public.sales WHERE product_name = %s AND id < %s ORDER BY id DESC LIMIT 31", ("x", 1_000_000)),
+    ("sales of one customer", "SELECT SUM(total), MAX(date) FROM public.sales WHERE customer_id = %s", (1,)),
+    ("sales of one variant", "SELECT SUM(qty) FROM public.sales WHERE variant_id = %s", (1,)),
+    ("report window", "SELECT SUM(revenue) FROM public.daily_summary WHERE day >= CURRENT_DATE - 62 AND day < CURRENT_DATE", None),
+    ("invoice lookup", "SELECT 1 FROM public.sales WHERE invoice_id = %s", ("x",)),
+    ("return duplicate check", "SELECT id FROM public.returns WHERE sale_id = %s", (1,)),
+    ("pending returns", "SELECT id, sale_id, variant_id FROM public.returns WHERE status = 'Pending' ORDER BY id DESC", None),
+    ("variant lookup", "SELECT id, stock FROM public.variants WHERE name = %s AND color = %s AND size = %s", ("x", "x", "x")),
+    ("customer by phone", "SELECT id FROM public.customers WHERE phone = %s ORDER BY id LIMIT 1", ("07700000000",)),
+    ("customer directory page", """
+        SELECT c.id, c.name, st.total_spend FROM public.customer_stats st
+        JOIN public.customers c ON c.id = st.customer_id
+        WHERE (st.total_spend, st.customer_id) < (%s, %s)
+        ORDER BY st.total_spend DESC, st.customer_id DESC LIMIT 21
+    """, (1e12, 0)),
+    ("variant search", f"""
+        SELECT id, name, color, size, price, stock, cost FROM public.variants
+        WHERE stock > 0 AND {VARIANT_SEARCH_TEXT} ILIKE %s
+        ORDER BY name, color, size LIMIT 50
+    """, ("%x%",)),
+]
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def check_indexes(conn, queries=HOT_QUERIES):
+    """
+    EXPLAINs each hot query with sequential scans disabled and reports the
+    indexes it uses. A query that still has a ``Seq Scan`` cannot use any
+    index (small tables would otherwise hide this behind cheap seq scans).
+    """
+    report = []
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for label, query, params in queries:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0][0]["Plan"]
+            nodes = list(_plan_nodes(plan))
+            report.append({
+                "query": label,
+                "indexes": sorted({n["Index Name"] for n in nodes if "Index Name" in n}),
+                "seq_scans": sorted({n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"}),
+            })
+    conn.rollback()
+    return report
@@ -0,0 +1,149 @@
+"""
+Background cache warming.
+
+After a rerun has rendered, ``main_app`` hands the prefetcher the reads of
+every section; a small thread pool runs them so switching tabs hits a warm
+``st.cache_data``. ``data.invalidate`` reports the functions it cleared:
+their queued tasks are cancelled, and a task that was already running when
+its data changed clears what it cached instead of leaving stale rows behind.
+
+Prefetching is opt-in, like the checkout journal and the listener: every
+sale, return or expense invalidates the reads and reschedules all of
+``section_reads`` (the report scans included) for each session, which adds
+database load to the write path.
+
+    [prefetch]
+    enabled = true
+    workers = 2
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+import data
+
+PREFETCH_DEFAULTS = {"enabled": False, "workers": 2}
+
+
+class Prefetcher:
+    """Runs cached reads on a bounded pool, at most once per data version and TTL."""
+
+    def __init__(self, workers=2, ttl=data.TTL_LIVE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._versions = {}  # id(cached func) -> عدد مرات إبطاله
+        self._queued = {}    # name -> (future, func)
+        self._warm = {}      # name -> (func, version, finished_at)
+        self.metrics = {"scheduled": 0, "ran": 0, "skipped": 0, "cancelled": 0, "stale": 0, "failed": 0, "ms": 0.0}
+        self.last_ms = {}
+
+    def cancel(self, funcs):
+        """Called by ``data.invalidate``: drops queued and warm entries of the cleared functions."""
+        cleared = {id(f) for f in funcs}
+        with self._lock:
+            for key in cleared:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            for name, (func, _, _) in list(self._warm.items()):
+                if id(func) in cleared:
+                    del self._warm[name]
+            for name, (future, func) in list(self._queued.items()):
+                if id(func) in cleared and future.cancel():
+                    del self._queued[name]
+                    self.metrics["cancelled"] += 1
+
+    def schedule(self, tasks):
+        """
+        Queues ``(name, cached_func, args, kwargs)`` tasks that are not
+        already warm for the current data version, queued or running.
+        """
+        ctx = get_script_run_ctx()
+        now = time.monotonic()
+        with self._lock:
+            for name, func, args, kwargs in tasks:
+                version = self._versions.get(id(func), 0)
+                warm = self._warm.get(name)
+                if name in self._queued or (warm and warm[1] == version and now - warm[2] < self._ttl):
+                    self.metrics["skipped"] += 1
+                    continue
+                self.metrics["scheduled"] += 1
+                future = self._executor.submit(self._run, name, func, args, kwargs, version, ctx)
+                self._queued[name] = (future, func)
+
+    def _run(self, name, func, args, kwargs, version, ctx):
+        try:
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+            started = time.perf_counter()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self.metrics["failed"] += 1
+                return
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.metrics["ms"] += elapsed
+                self.last_ms[name] = round(elapsed, 1)
+                # تغيرت البيانات أثناء القراءة: لا نترك نتيجة قديمة في الكاش
+                stale = self._versions.get(id(func), 0) != version
+                if not stale:
+                    self.metrics["ran"] += 1
+                    self._warm[name] = (func, version, time.monotonic())
+            if stale:
+                func.clear()
+                with self._lock:
+                    self.metrics["stale"] += 1
+        finally:
+            with self._lock:
+                self._queued.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **{k: round(v, 1) for k, v in self.metrics.items()},
+                "queued": len(self._queued),
+                "warm": len(self._warm),
+            }
+
+
+def section_reads(today):
+    """
+    The first-screen reads of every section, called exactly as the sections
+    call them: ``st.cache_data`` keys on the arguments as passed.
+    """
+    no_filters = {"before_id": None, "day_from": None, "day_to": None, "customer_id": None, "product": None}
+    return [
+        ("sale: variant search", data.search_variants, ("",), {}),
+        ("log: first page", data.load_sales_page, (), no_filters),
+        ("log: products", data.load_product_names, (), {}),
+        ("returns: pending", data.load_pending_returns, (), {}),
+        ("customers: first page", data.load_customer_page, ("", None), {}),
+        ("inventory: totals", data.inventory_totals, (), {}),
+        ("inventory: tree", data.inventory_tree, ("",), {}),
+        ("expenses: recent", data.load_recent_expenses, (50,), {}),
+        ("reports: period totals", data.period_totals, (today,), {}),
+        ("reports: stock value", data.stock_value, (), {}),
+        ("reports: top items", data.top_items, (10,), {}),
+        ("reports: top customers", data.top_customers, (10,), {}),
+        ("reports: top colors", data.top_colors, (5,), {}),
+        ("reports: top sizes", data.top_sizes, (5,), {}),
+    ]
+
+
+def settings():
+    return {**PREFETCH_DEFAULTS, **st.secrets.get("prefetch", {})}
+
+
+@st.cache_resource
+def get_prefetcher():
+    """The process-wide prefetcher, or ``None`` when disabled in secrets."""
+    config = settings()
+    if not config["enabled"]:
+        return None
+    prefetcher = Prefetcher(workers=int(config["workers"]))
+    data.on_invalidate(prefetcher.cancel)
+    return prefetcher
@@ -0,0 +1,95 @@
+"""
+Opt-in render profiler.
+
+``start`` wraps the script run context's ``enqueue`` so every delta the
+section sends to the browser is counted (elements, layout blocks, bytes).
+A section is split into segments with ``mark("name")``; each segment gets
+its wall time and the deltas emitted while it was current. ``mark`` is a
+no-op when no profile is running, so the calls stay in the app for free.
+"""
+import threading
+import time
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+_local = threading.local()
+
+
+class Profile:
+    """Segments of one section rerun, in execution order."""
+
+    def __init__(self, label):
+        self.label = label
+        self.segments = []
+        self._opened = None
+        self.mark("—")
+
+    def mark(self, name):
+        self._close()
+        self.segments.append({"segment": name, "ms": 0.0, "elements": 0, "blocks": 0, "deltas": 0, "kb": 0.0})
+        self._opened = time.perf_counter()
+
+    def _close(self):
+        if self._opened is not None and self.segments:
+            self.segments[-1]["ms"] = round((time.perf_counter() - self._opened) * 1000, 2)
+            self.segments[-1]["kb"] = round(self.segments[-1]["kb"], 1)
+        self._opened = None
+
+    def count(self, msg):
+        if msg.WhichOneof("type") != "delta":
+            return
+        current = self.segments[-1]
+        current["deltas"] += 1
+        current["kb"] += msg.ByteSize() / 1024
+        kind = msg.delta.WhichOneof("type")
+        if kind == "new_element":
+            current["elements"] += 1
+        elif kind == "add_block":
+            current["blocks"] += 1
+
+    def rows(self):
+        """Segments with the section label, for a DataFrame; empty leading segments are dropped."""
+        return [
+            {"section": self.label, **s}
+            for i, s in enumerate(self.segments)
+            if i or s["deltas"] or s["ms"] >= 1
+        ]
+
+
+def start(label):
+    """Starts profiling the current script run; returns ``None`` outside a Streamlit run."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    profile = Profile(label)
+    original = ctx.enqueue
+    # enqueue يُستعاد كما كان: دالة الصنف أو غلاف سابق على الكائن
+    own = "enqueue" in vars(ctx)
+
+    def counting(msg):
+        profile.count(msg)
+        original(msg)
+
+    ctx.enqueue = counting
+    _local.active = (profile, ctx, original if own else None)
+    return profile
+
+
+def mark(name):
+    active = getattr(_local, "active", None)
+    if active is not None:
+        active[0].mark(name)
+
+
+def finish():
+    active = getattr(_local, "active", None)
+    _local.active = None
+    if active is None:
+        return None
+    profile, ctx, original = active
+    profile._close()
+    if original is None:
+        del ctx.enqueue
+    else:
+        ctx.enqueue = original
+    return profile
@@ -0,0 +1,156 @@
+"""
+Per-rerun SQL instrumentation.
+
+Every pooled connection creates ``TracingCursor`` cursors (see
+``db.get_pool``), so reads through ``pd.read_sql`` and writes through
+``db.transaction`` are both timed. Statements executed between ``start``
+and ``finish`` on the script thread are collected into one ``Trace`` per
+rerun; statements slower than the threshold are also appended to a log
+file, whichever thread ran them.
+
+Settings come from an optional ``[sqltrace]`` section in secrets::
+
+    [sqltrace]
+    slow_ms = 500                  # log statements at least this slow
+    log_path = "slow_queries.log"
+"""
+import logging
+import re
+import threading
+import time
+
+import streamlit as st
+from psycopg2 import extensions
+
+TRACE_DEFAULTS = {"slow_ms": 500, "log_path": "slow_queries.log"}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SPACES = re.compile(r"\s+")
+
+_local = threading.local()
+_logger = logging.getLogger("nawaem.slow_sql")
+_logger_lock = threading.Lock()
+
+
+def settings():
+    try:
+        configured = st.secrets.get("sqltrace", {})
+    except Exception:
+        configured = {}
+    return {**TRACE_DEFAULTS, **configured}
+
+
+def statement_text(query, limit=300):
+    """One-line statement text with string literals masked (execute_values inlines the values)."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    text = _SPACES.sub(" ", _STRING_LITERAL.sub("'?'", query)).strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _kind(value):
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(params):
+    """Types (and sequence lengths) of the bound parameters, never their values."""
+    if params is None:
+        return ""
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {_kind(v)}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(_kind(v) for v in params) + ")"
+    return _kind(params)
+
+
+class Trace:
+    """Statements issued during one rerun of one section."""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self.statements = []
+
+    @property
+    def total_ms(self):
+        return sum(s["ms"] for s in self.statements)
+
+    def summary(self):
+        return {
+            "at": time.strftime("%H:%M:%S", time.localtime(self.started)),
+            "section": self.label,
+            "statements": len(self.statements),
+            "sql_ms": round(self.total_ms, 1),
+            "errors": sum(1 for s in self.statements if s["error"]),
+        }
+
+
+def start(label):
+    _local.trace = Trace(label)
+    return _local.trace
+
+
+def finish():
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    return trace
+
+
+def _slow_logger(path):
+    with _logger_lock:
+        if not _logger.handlers:
+            handler = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+    return _logger
+
+
+def record(query, shape, rows, ms, error=None):
+    trace = getattr(_local, "trace", None)
+    entry = {
+        "sql": statement_text(query),
+        "params": shape,
+        "rows": rows,
+        "ms": round(ms, 2),
+        "error": error,
+    }
+    if trace is not None:
+        trace.statements.append(entry)
+    config = settings()
+    if ms >= float(config["slow_ms"]):
+        _slow_logger(config["log_path"]).info(
+            "%.0fms rows=%s section=%s params=%s%s sql=%s",
+            ms, rows, trace.label if trace else "-", entry["params"] or "-",
+            f" error={error}" if error else "", entry["sql"]
+        )
+
+
+class TracingCursor(extensions.cursor):
+    """Cursor that reports every statement to ``record``."""
+
+    def _timed(self, run, query, shape):
+        started = time.perf_counter()
+        try:
+            result = run()
+        except Exception as e:
+            record(query, shape, None, (time.perf_counter() - started) * 1000, type(e).__name__)
+            raise
+        record(query, shape, self.rowcount, (time.perf_counter() - started) * 1000)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(lambda: super(TracingCursor, self).execute(query, vars), query, params_shape(vars))
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        shape = f"{len(vars_list)} x {params_shape(vars_list[0])}" if vars_list else ""
+        return self._timed(lambda: super(TracingCursor, self).executemany(query, vars_list), query, shape)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(lambda: super(TracingCursor, self).copy_expert(sql, file, size), sql, "")
@@ -0,0 +1,158 @@
+"""
+Incrementally maintained totals: ``public.daily_summary`` and
+``public.customer_stats``.
+
+``daily_summary`` has one row per Asia/Baghdad calendar day with revenue,
+profit, invoice count, units sold and expenses; ``customer_stats`` has one
+row per customer with lifetime spend, order (invoice) count and last
+purchase. Write paths call the helpers below with their own cursor, so the
+totals change in the same transaction as the rows they describe.
+``rebuild`` and ``rebuild_customer_stats`` recompute the tables from
+scratch (``python manage.py rebuild-summary`` / ``rebuild-customer-stats``).
+"""
+import pytz
+
+BAGHDAD_TZ = pytz.timezone('Asia/Baghdad')
+
+# يوم بغداد لقيمة TIMESTAMP مخزنة (نفس تحويل الجلسة المستخدم عند الحفظ)
+DAY_OF_DATE = "(date::timestamptz AT TIME ZONE 'Asia/Baghdad')::date"
+
+
+def bump(cur, day, revenue=0, profit=0, invoices=0, units=0, expenses=0):
+    """Adds the given deltas to the summary row for ``day``, creating it if needed."""
+    cur.execute("""
+        INSERT INTO public.daily_summary AS d (day, revenue, profit, invoices, units, expenses)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (day) DO UPDATE SET
+            revenue = d.revenue + EXCLUDED.revenue,
+            profit = d.profit + EXCLUDED.profit,
+            invoices = d.invoices + EXCLUDED.invoices,
+            units = d.units + EXCLUDED.units,
+            expenses = d.expenses + EXCLUDED.expenses
+    """, (day, float(revenue), float(profit), int(invoices), int(units), float(expenses)))
+
+
+def baghdad_day(when):
+    return when.astimezone(BAGHDAD_TZ).date()
+
+
+def sale_added(cur, when, invoice_id, revenue, profit, units, customer_id=None):
+    """
+    Records a checkout. Call before inserting the sale lines: the invoice is
+    only counted if no earlier line already carries ``invoice_id``.
+    """
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM public.sales WHERE invoice_id = %s),
+               EXISTS (SELECT 1 FROM public.sales WHERE invoice_id = %s AND customer_id = %s)
+    """, (invoice_id, invoice_id, customer_id))
+    seen, seen_by_customer = cur.fetchone()
+    bump(cur, baghdad_day(when), revenue=revenue, profit=profit, units=units, invoices=int(not seen))
+    if customer_id is not None:
+        bump_customer(cur, customer_id, spend=revenue, orders=int(not seen_by_customer), last_purchase=when)
+
+
+def sale_updated(cur, sale_id, qty, total):
+    """Records an edit of one sale line. Call before the UPDATE."""
+    cur.execute(
+        f"SELECT {DAY_OF_DATE}, qty, total, customer_id FROM public.sales WHERE id = %s FOR UPDATE",
+        (int(sale_id),)
+    )
+    row = cur.fetchone()
+    if not row:
+        return
+    day, old_qty, old_total, customer_id = row
+    if day is not None:
+        bump(cur, day, revenue=float(total) - (old_total or 0), units=int(qty) - (old_qty or 0))
+    if customer_id is not None:
+        bump_customer(cur, customer_id, spend=float(total) - (old_total or 0))
+
+
+def sale_deleted(cur, sale_id):
+    """Records the deletion of one sale line. Call before the DELETE."""
+    cur.execute(
+        f"SELECT {DAY_OF_DATE}, qty, total, profit, invoice_id, customer_id FROM public.sales WHERE id = %s FOR UPDATE",
+        (int(sale_id),)
+    )
+    row = cur.fetchone()
+    if not row:
+        return
+    day, qty, total, profit, invoice_id, customer_id = row
+    last_line = last_customer_line = False
+    if invoice_id is not None:
+        cur.execute("""
+            SELECT NOT EXISTS (SELECT 1 FROM public.sales WHERE invoice_id = %s AND id <> %s),
+                   NOT EXISTS (SELECT 1 FROM public.sales WHERE invoice_id = %s AND id <> %s AND customer_id = %s)
+        """, (invoice_id, int(sale_id), invoice_id, int(sale_id), customer_id))
+        last_line, last_customer_line = cur.fetchone()
+    if day is not None:
+        bump(cur, day, revenue=-(total or 0), profit=-(profit or 0), units=-(qty or 0), invoices=-int(last_line))
+    if customer_id is not None:
+        bump_customer(cur, customer_id, spend=-(total or 0), orders=-int(last_customer_line))
+        # آخر شراء يُعاد حسابه من بقية أسطر الزبون (فهرس customer_id, date)
+        cur.execute("""
+            UPDATE public.customer_stats SET last_purchase = (
+                SELECT MAX(date) FROM public.sales WHERE customer_id = %s AND id <> %s
+            ) WHERE customer_id = %s
+        """, (customer_id, int(sale_id), customer_id))
+
+
+def bump_customer(cur, customer_id, spend=0, orders=0, last_purchase=None):
+    """Adds the deltas to the stats row of ``customer_id``; ``last_purchase`` only moves forward."""
+    cur.execute("""
+        INSERT INTO public.customer_stats AS c (customer_id, total_spend, orders, last_purchase)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (customer_id) DO UPDATE SET
+            total_spend = c.total_spend + EXCLUDED.total_spend,
+            orders = c.orders + EXCLUDED.orders,
+            last_purchase = GREATEST(c.last_purchase, EXCLUDED.last_purchase)
+    """, (int(customer_id), float(spend), int(orders), last_purchase))
+
+
+def expense_added(cur, when, amount):
+    bump(cur, baghdad_day(when), expenses=amount)
+
+
+def expense_deleted(cur, expense_id):
+    """Records the deletion of an expense. Call before the DELETE."""
+    cur.execute(f"SELECT {DAY_OF_DATE}, amount FROM public.expenses WHERE id = %s", (int(expense_id),))
+    row = cur.fetchone()
+    if row and row[0] is not None:
+        bump(cur, row[0], expenses=-(row[1] or 0))
+
+
+def rebuild(cur):
+    """Recomputes ``daily_summary`` from scratch."""
+    cur.execute("LOCK TABLE public.daily_summary IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM public.daily_summary")
+    cur.execute(f"""
+        INSERT INTO public.daily_summary (day, revenue, profit, invoices, units, expenses)
+        SELECT day,
+               COALESCE(SUM(revenue), 0), COALESCE(SUM(profit), 0),
+               COALESCE(SUM(invoices), 0), COALESCE(SUM(units), 0), COALESCE(SUM(expenses), 0)
+        FROM (
+            SELECT {DAY_OF_DATE} AS day, SUM(total) AS revenue, SUM(profit) AS profit,
+                   COUNT(DISTINCT invoice_id) AS invoices, SUM(qty) AS units, NULL::float8 AS expenses
+            FROM public.sales WHERE date IS NOT NULL
+            GROUP BY 1
+            UNION ALL
+            SELECT {DAY_OF_DATE}, NULL, NULL, NULL, NULL, SUM(amount)
+            FROM public.expenses WHERE date IS NOT NULL
+            GROUP BY 1
+        ) t
+        GROUP BY day
+    """)
+    return cur.rowcount
+
+
+def rebuild_customer_stats(cur):
+    """Recomputes ``customer_stats`` from scratch, one row per customer."""
+    cur.execute("LOCK TABLE public.customer_stats IN EXCLUSIVE MODE")
+    cur.execute("DELETE FROM public.customer_stats")
+    cur.execute("""
+        INSERT INTO public.customer_stats (customer_id, total_spend, orders, last_purchase)
+        SELECT c.id, COALESCE(SUM(s.total), 0), COUNT(DISTINCT s.invoice_id), MAX(s.date)
+        FROM public.customers c
+        LEFT JOIN public.sales s ON s.customer_id = c.id
+        GROUP BY c.id
+    """)
+    return cur.rowcount